@@ -0,0 +1,129 @@
+import argparse
+import json
+import statistics
+from collections import defaultdict
+
+
+def load_spans(path):
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+    return spans
+
+
+def critical_path(span, children):
+    """
+    From a span, repeatedly follow the child that finished last (it gated the parent's end).
+    Fire-and-forget children that outlive their parent did not gate it and are skipped.
+    """
+    path = [span]
+    while True:
+        gating = [c for c in children.get(span["spanId"], []) if c["endTimeUnixNano"] <= span["endTimeUnixNano"]]
+        if not gating:
+            return path
+        span = max(gating, key=lambda s: s["endTimeUnixNano"])
+        path.append(span)
+
+
+def report(spans, top):
+    by_name = defaultdict(list)
+    traces = defaultdict(list)
+    for span in spans:
+        by_name[span["name"]].append(span["durationMs"])
+        traces[span["traceId"]].append(span)
+
+    print("=" * 70)
+    print(f"📊 {len(spans)} spans in {len(traces)} traces")
+    print("=" * 70)
+
+    print("\n[1] Span latency by name (ms)")
+    print(f"{'name':32} {'count':>6} {'p50':>9} {'p95':>9} {'max':>9}")
+    rows = []
+    for name, durations in by_name.items():
+        durations.sort()
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        rows.append((name, len(durations), statistics.median(durations), p95, durations[-1]))
+    for name, count, p50, p95, worst in sorted(rows, key=lambda r: r[3], reverse=True):
+        print(f"{name:32} {count:>6} {p50:>9.1f} {p95:>9.1f} {worst:>9.1f}")
+
+    print(f"\n[2] Top {top} slowest spans")
+    for span in sorted(spans, key=lambda s: s["durationMs"], reverse=True)[:top]:
+        print(f"{span['durationMs']:>10.1f} ms  {span['name']:32} trace={span['traceId'][:16]} {span.get('attributes', {})}")
+
+    print(f"\n[3] Critical paths of the {top} slowest traces")
+    roots = []
+    for trace_spans in traces.values():
+        ids = {s["spanId"] for s in trace_spans}
+        trace_roots = [s for s in trace_spans if not s.get("parentSpanId") or s["parentSpanId"] not in ids]
+        if trace_roots:
+            roots.append((max(trace_roots, key=lambda s: s["durationMs"]), trace_spans))
+
+    for root, trace_spans in sorted(roots, key=lambda r: r[0]["durationMs"], reverse=True)[:top]:
+        children = defaultdict(list)
+        for s in trace_spans:
+            if s.get("parentSpanId"):
+                children[s["parentSpanId"]].append(s)
+        print(f"\ntrace {root['traceId'][:16]}  total {root['durationMs']:.1f} ms  {root.get('attributes', {})}")
+        for depth, s in enumerate(critical_path(root, children)):
+            child_ms = sum(c["durationMs"] for c in children.get(s["spanId"], []))
+            self_ms = max(0.0, s["durationMs"] - child_ms)
+            print(f"  {'  ' * depth}└ {s['name']:30} {s['durationMs']:>9.1f} ms (self {self_ms:.1f} ms)")
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans):
+    """OTLP/JSON ExportTraceServiceRequest (POST to a collector's /v1/traces)."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "k-voice-coach"}}]},
+            "scopeSpans": [{
+                "scope": {"name": "services.tracing"},
+                "spans": [{
+                    "traceId": s["traceId"],
+                    "spanId": s["spanId"],
+                    "parentSpanId": s.get("parentSpanId") or "",
+                    "name": s["name"],
+                    "kind": 1,
+                    "startTimeUnixNano": str(s["startTimeUnixNano"]),
+                    "endTimeUnixNano": str(s["endTimeUnixNano"]),
+                    "attributes": [
+                        {"key": k, "value": _otlp_value(v)}
+                        for k, v in (s.get("attributes") or {}).items() if v is not None
+                    ],
+                    "status": {"code": 2 if s.get("status") == "ERROR" else 1}
+                } for s in spans]
+            }]
+        }]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Slowest spans and critical paths from a spans.jsonl export.")
+    parser.add_argument("path", nargs="?", default="spans.jsonl")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--otlp", metavar="OUT", help="Also write the spans as OTLP/JSON to OUT")
+    args = parser.parse_args()
+
+    spans = load_spans(args.path)
+    report(spans, args.top)
+
+    if args.otlp:
+        with open(args.otlp, "w", encoding="utf-8") as f:
+            json.dump(to_otlp(spans), f)
+        print(f"\n✅ Wrote OTLP/JSON to {args.otlp}")
+
+
+if __name__ == "__main__":
+    main()
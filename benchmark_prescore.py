@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config import PRESCORE_PASS_SCORE, PRESCORE_FAIL_SCORE, PRESCORE_DISTANCE_GOOD, PRESCORE_DISTANCE_BAD
+from services.audio_service import AudioService
+from services.curriculum import PASS_SCORE, reference_text
+from services.db_service import empty_progress
+
+
+def load_manifest(path):
+    """
+    JSON Lines, one recording per line:
+    {"path": "attempt.ogg", "lesson": 3, "gemini_score": 8}
+    `lesson` is the 1-based lesson number; `gemini_score` is optional (use --gemini to fill it in).
+    """
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def gemini_score(service, audio_path, lesson_index):
+    """Scores one recording with Gemini; returns (score, seconds)."""
+    mp3_path = audio_path
+    if audio_path.endswith(".ogg"):
+        mp3_path = AudioService.convert_ogg_to_mp3(audio_path)
+    start = time.perf_counter()
+    gemini_file = await service.upload_audio(mp3_path)
+    try:
+        progress = empty_progress("benchmark")
+        progress["lesson_index"] = lesson_index
+        analysis = await service.analyze_audio(gemini_file, progress=progress, user_id="benchmark")
+    finally:
+        service.cleanup_gemini_file(gemini_file)
+        if mp3_path != audio_path:
+            AudioService.cleanup_files(mp3_path)
+    return int(analysis.get("pronunciation_score") or 0), time.perf_counter() - start
+
+
+def pearson(xs, ys):
+    if len(xs) < 2 or statistics.pstdev(xs) == 0 or statistics.pstdev(ys) == 0:
+        return float("nan")
+    mx, my = statistics.mean(xs), statistics.mean(ys)
+    cov = sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / len(xs)
+    return cov / (statistics.pstdev(xs) * statistics.pstdev(ys))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Agreement and latency of the local MFCC+DTW pre-scorer vs Gemini.")
+    parser.add_argument("manifest", help="JSONL with path, lesson (1-based) and optional gemini_score")
+    parser.add_argument("--gemini", action="store_true", help="Call Gemini for rows without gemini_score (and time it)")
+    parser.add_argument("--pass-score", type=float, default=PRESCORE_PASS_SCORE)
+    parser.add_argument("--fail-score", type=float, default=PRESCORE_FAIL_SCORE)
+    parser.add_argument("--good-distance", type=float, default=PRESCORE_DISTANCE_GOOD)
+    parser.add_argument("--bad-distance", type=float, default=PRESCORE_DISTANCE_BAD)
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("🎯 Pre-score benchmark")
+    print("=" * 50)
+
+    service = None
+    if args.gemini:
+        from services.gemini_service import GeminiService
+        service = GeminiService()
+
+    rows = []
+    local_latencies, gemini_latencies = [], []
+    for item in load_manifest(args.manifest):
+        lesson_index = int(item["lesson"]) - 1
+        phrase = reference_text(lesson_index)
+        if not phrase:
+            print(f"- skip {item['path']}: lesson {item['lesson']} has no fixed reference phrase")
+            continue
+
+        # Reference TTS is synthesized once per phrase, outside the measured time
+        await AudioService.reference_features(phrase)
+        start = time.perf_counter()
+        score, distance = await AudioService.prescore(item["path"], phrase, args.good_distance, args.bad_distance)
+        local_latencies.append(time.perf_counter() - start)
+
+        reference_score = item.get("gemini_score")
+        if reference_score is None and service:
+            reference_score, seconds = await gemini_score(service, item["path"], lesson_index)
+            gemini_latencies.append(seconds)
+
+        decision = "pass" if score >= args.pass_score else "fail" if score <= args.fail_score else "unsure"
+        rows.append((score, distance, decision, reference_score))
+        print(f"- {item['path']}: local {score:>4}/10 (DTW {distance:.3f}, {decision})  gemini {reference_score}")
+
+    scored = [(local, float(ref)) for local, _, _, ref in rows if ref]
+    print(f"\nRecordings: {len(rows)} ({len(scored)} with a Gemini score)")
+    if local_latencies:
+        print(f"Local latency p50={statistics.median(local_latencies) * 1000:.0f}ms  max={max(local_latencies) * 1000:.0f}ms")
+    if gemini_latencies:
+        print(f"Gemini latency p50={statistics.median(gemini_latencies):.2f}s  mean={statistics.mean(gemini_latencies):.2f}s")
+
+    if scored:
+        locals_, refs = zip(*scored)
+        mae = statistics.mean(abs(a - b) for a, b in scored)
+        agree = sum((a >= PASS_SCORE) == (b >= PASS_SCORE) for a, b in scored) / len(scored)
+        print(f"MAE={mae:.2f}  Pearson r={pearson(locals_, refs):.2f}  pass/fail agreement={agree:.0%}")
+
+        # What matters for skipping: how often a clear local decision contradicts Gemini
+        for label, check in (("pass", lambda ref: ref >= PASS_SCORE), ("fail", lambda ref: ref < PASS_SCORE)):
+            decided = [ref for _, _, decision, ref in rows if decision == label and ref]
+            if decided:
+                correct = sum(check(float(ref)) for ref in decided)
+                print(f"Clear {label}: {len(decided)} ({correct / len(decided):.0%} confirmed by Gemini)")
+
+    skipped = sum(1 for _, _, decision, _ in rows if decision == "pass")
+    if rows:
+        print(f"\nGemini calls skippable with PRESCORE_MODE=on: {skipped}/{len(rows)} ({skipped / len(rows):.0%})")
+        if gemini_latencies:
+            saved = skipped * statistics.mean(gemini_latencies) - sum(local_latencies)
+            print(f"✅ Estimated latency saved: {saved:.1f}s total, {saved / len(rows):.2f}s per attempt")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
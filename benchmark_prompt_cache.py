@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import statistics
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.gemini_service import GeminiService
+from services.usage_service import UsageTracker
+
+SAMPLE_TEXTS = ["Annyeonghaseyo", "Necesito decir gracias", "Como digo cuanto cuesta?", "Gamsahamnida"]
+
+
+async def run(service, tracker, rounds, label):
+    latencies = []
+    for i in range(rounds):
+        text = SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]
+        start = time.perf_counter()
+        await service.analyze_text(text, user_id=label)
+        latencies.append(time.perf_counter() - start)
+    usage = tracker.user_today(label)
+    return latencies, usage
+
+
+def summarize(label, latencies, usage):
+    calls = max(usage["calls"], 1)
+    print(f"\n[{label}] {len(latencies)} calls")
+    print(f"  latency p50={statistics.median(latencies):.2f}s  mean={statistics.mean(latencies):.2f}s  max={max(latencies):.2f}s")
+    print(f"  input tokens/call={usage['input'] / calls:.0f}  cached tokens/call={usage['cached'] / calls:.0f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare analyze_text with and without the SYSTEM_PROMPT context cache.")
+    parser.add_argument("--rounds", type=int, default=8)
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("⏱  Prompt cache benchmark")
+    print("=" * 50)
+
+    tracker = UsageTracker()
+    uncached = GeminiService(usage_tracker=tracker)
+    uncached.prompt_cache = None
+    cached = GeminiService(usage_tracker=tracker)
+
+    # Warm the cache outside the measured loop
+    model, path = await cached.prompt_cache.model()
+    if path != "cached":
+        print("⚠️ Cache could not be created (see log); cached run will fall back to the plain prompt.")
+
+    base = await run(uncached, tracker, args.rounds, "uncached")
+    with_cache = await run(cached, tracker, args.rounds, "cached")
+    summarize("uncached", *base)
+    summarize("cached", *with_cache)
+
+    saved = statistics.median(base[0]) - statistics.median(with_cache[0])
+    print(f"\n✅ Median latency saved per call: {saved:.2f}s")
+    cached.prompt_cache.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,15 +1,48 @@
 
 import logging
 import asyncio
+import functools
 import os
+from datetime import datetime, time as dtime
+from pathlib import Path
+from zoneinfo import ZoneInfo
 from telegram import Update, constants
-from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, filters
+from telegram.error import BadRequest
+from telegram.ext import (
+    ApplicationBuilder, ApplicationHandlerStop, ContextTypes, CommandHandler, MessageHandler, TypeHandler, filters
+)
 
-from config import TELEGRAM_TOKEN, validate_env
+from config import (
+    TELEGRAM_TOKEN, HISTORY_LIMIT, TEXT_DEBOUNCE_SECONDS, TEXT_DEBOUNCE_MAX_WAIT,
+    LOAD_DEPTH_THRESHOLDS, LOAD_LATENCY_THRESHOLDS, LOAD_RECOVERY_RATIO, LOAD_REDUCED_HISTORY,
+    UPDATE_QUEUE_PATH, UPDATE_QUEUE_MAX_ATTEMPTS, UPDATE_QUEUE_WORKERS, SHUTDOWN_GRACE_SECONDS,
+    DAILY_TOKEN_BUDGET, LONG_VOICE_SECONDS, SEGMENT_MAX_SECONDS,
+    OUTBOX_GLOBAL_RATE, OUTBOX_CHAT_RATE, OUTBOX_CHAT_BURST, MERGE_FEEDBACK_CAPTION,
+    ANALYSIS_CACHE_TTL, ANALYSIS_CACHE_SIZE,
+    PRESCORE_MODE, PRESCORE_MAX_SECONDS, PRESCORE_PASS_SCORE, PRESCORE_FAIL_SCORE,
+    PRESCORE_DISTANCE_GOOD, PRESCORE_DISTANCE_BAD,
+    REMINDERS_ENABLED, REMINDER_TIME, REMINDER_TIMEZONE, REMINDER_INACTIVE_HOURS, REMINDER_MAX_INACTIVE_DAYS,
+    REMINDER_RATE, REMINDER_BATCH_SIZE, REMINDER_STATE_PATH,
+    TELEGRAM_POLL_POOL_SIZE, TELEGRAM_POLL_TIMEOUT, TELEGRAM_SEND_POOL_SIZE, TELEGRAM_SEND_TIMEOUT,
+    TELEGRAM_UPLOAD_TIMEOUT, TELEGRAM_DOWNLOAD_POOL_SIZE, TELEGRAM_DOWNLOAD_TIMEOUT, TELEGRAM_POOL_TIMEOUT,
+    UPDATE_WORKERS, LANE_LIMITS, LANE_WEIGHTS, LANE_SLOS,
+    validate_env
+)
 
-from services.audio_service import AudioService
+from services.audio_service import AudioService, tts_service
 from services.gemini_service import GeminiService
 from services.db_service import DBService
+from services.message_coalescer import MessageCoalescer
+from services.load_governor import LoadGovernor, LoadMode
+from services.update_queue import UpdateQueue
+from services.usage_service import UsageTracker
+from services.telegram_request import TracedHTTPXRequest, FileDownloader
+from services.outbox import Outbox
+from services.analysis_cache import AnalysisCache, content_digest
+from services.reminder_service import ReminderService
+from services.update_lanes import LaneScheduler, LaneUpdateProcessor, parse_lane_setting
+from services import diagnostics, tracing
+from services.curriculum import LESSONS, PASS_SCORE, get_lesson, weak_phrases, reference_text, local_pass_analysis
 from keep_alive import keep_alive
 
 # Start the web server to keep the bot alive (for Render/Railway)
@@ -19,26 +52,213 @@ validate_env()
 
 # Logging setup
 logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s',
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
 
 # Initialize Services
 audio_service = AudioService()
-gemini_service = GeminiService()
+usage_tracker = UsageTracker(daily_budget=DAILY_TOKEN_BUDGET)
+gemini_service = GeminiService(usage_tracker=usage_tracker)
 db_service = DBService()
+update_queue = UpdateQueue(UPDATE_QUEUE_PATH, max_attempts=UPDATE_QUEUE_MAX_ATTEMPTS)
+load_governor = LoadGovernor(
+    depth_thresholds=LOAD_DEPTH_THRESHOLDS,
+    latency_thresholds=LOAD_LATENCY_THRESHOLDS,
+    recovery_ratio=LOAD_RECOVERY_RATIO
+)
+# Priority lanes: /ping and /start never queue behind voice analyses
+lane_scheduler = LaneScheduler(
+    limits=parse_lane_setting(LANE_LIMITS, int),
+    weights=parse_lane_setting(LANE_WEIGHTS),
+    slos=parse_lane_setting(LANE_SLOS),
+    workers=UPDATE_WORKERS
+)
+# Voice notes are downloaded into memory on their own connection pool (not the send pool)
+file_downloader = FileDownloader(
+    pool_size=TELEGRAM_DOWNLOAD_POOL_SIZE,
+    timeout=TELEGRAM_DOWNLOAD_TIMEOUT,
+    pool_timeout=TELEGRAM_POOL_TIMEOUT
+)
+# Every Bot API send goes through here (rate limits, priorities, RetryAfter)
+outbox = Outbox(global_rate=OUTBOX_GLOBAL_RATE, chat_rate=OUTBOX_CHAT_RATE, chat_burst=OUTBOX_CHAT_BURST)
+# Re-forwarded / redelivered voice notes reuse the earlier reply instead of a new Gemini pass
+analysis_cache = AnalysisCache(ttl=ANALYSIS_CACHE_TTL, max_entries=ANALYSIS_CACHE_SIZE)
+# Daily practice reminders: low-priority, paced, paused while the bot is under load
+reminder_service = ReminderService(
+    db_service, outbox, audio_service, REMINDER_STATE_PATH,
+    inactive_hours=REMINDER_INACTIVE_HOURS,
+    max_inactive_days=REMINDER_MAX_INACTIVE_DAYS,
+    rate=REMINDER_RATE,
+    batch_size=REMINDER_BATCH_SIZE,
+    should_pause=lambda: load_governor.mode != LoadMode.NORMAL
+)
+
+# Live snapshots for the admin /admin/status endpoint
+diagnostics.register_status("lanes", lane_scheduler.stats)
+diagnostics.register_status("db_pool", db_service.pool_stats)
+diagnostics.register_status("tts", tts_service.stats)
+diagnostics.register_status("usage_today", usage_tracker.day_totals)
+diagnostics.register_status("reminders", reminder_service.status)
+
+# Fire-and-forget work (DB writes) that graceful shutdown still waits for
+background_tasks = set()
+
+def spawn(coro):
+    """create_task that keeps a reference so shutdown can drain it."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# update_id -> root span, opened in journal_update and closed in ack_update
+update_spans = {}
+
+async def journal_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Group -1: persist every update before any handler runs; skip duplicates."""
+    if not update_queue.claim(update):
+        logger.info(f"Skipping duplicate update {update.update_id}")
+        raise ApplicationHandlerStop
+
+    # Root span: everything the handlers do (including spawned DB writes) nests under it
+    kind = "voice" if update.message and update.message.voice else "text" if update.message and update.message.text else "other"
+    update_spans[update.update_id] = tracing.start_span(
+        "update",
+        update_id=update.update_id,
+        kind=kind,
+        user_id=update.effective_user.id if update.effective_user else None
+    )
+    # Writing to the bot again means it is no longer blocked: include the user in reminders again
+    if update.effective_user:
+        reminder_service.unblock(update.effective_user.id)
+
+async def ack_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Last group: all handlers for this update have finished."""
+    update_queue.ack(update.update_id)
+    root = update_spans.pop(update.update_id, None)
+    if root:
+        tracing.end_span(root)
+
+BUSY_TEXT = "⏳ Estoy con mucha carga ahora mismo. Inténtalo de nuevo en un momento, por favor."
+BUDGET_TEXT = "🪫 Has alcanzado tu límite de práctica de hoy. ¡Vuelve mañana para seguir aprendiendo!"
+
+def governed(pipeline):
+    """
+    Runs a heavy pipeline under the load governor: sheds it with a busy reply
+    when overloaded or when the user's daily token budget is spent,
+    otherwise passes the current LoadMode as `mode`.
+    """
+    @functools.wraps(pipeline)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args):
+        if usage_tracker.over_budget(update.effective_user.id):
+            await outbox.send(update.effective_chat.id, "send_message", text=BUDGET_TEXT)
+            return
+        mode = load_governor.mode
+        if mode >= LoadMode.SHED:
+            load_governor.record_shed()
+            await outbox.send(update.effective_chat.id, "send_message", text=BUSY_TEXT)
+            return
+        with load_governor.track():
+            await pipeline(update, context, *args, mode=mode)
+    return wrapper
+
+def build_reply_caption(analysis):
+    """
+    Caption for the audio reply:
+    🇰🇷 [Hangul] / 🔤 [Romanization] / 📖 [Phonetic-ES] / 🇪🇸 [Translation]
+    Feature B: Blind Training - Hide Korean/Romanization to force listening
+    """
+    return (
+        f"🇰🇷 ||{analysis.get('reply_text')}||\n"
+        f"🔤 ||{analysis.get('reply_romanized', '')}||\n"
+        f"📖 *{analysis.get('reply_phonetic_es', 'No phonetic')}*\n"
+        f"🇪🇸 {analysis.get('reply_translation', 'Trad: ???')}"
+    )
+
+def score_emoji(score):
+    """🟢/🟡/🔴 for a 0-10 score; ⚪ when Gemini returned none or a non-numeric one."""
+    try:
+        value = float(score)
+    except (TypeError, ValueError):
+        return "⚪"
+    return "🟢" if value >= 9 else "🟡" if value >= 7 else "🔴"
+
+def build_feedback_card(analysis):
+    """Step C: pronunciation score + transcription + feedback for voice turns."""
+    score = analysis.get("pronunciation_score", "?")
+    emoji_score = score_emoji(score)
+    
+    return (
+        f"📊 **Pronunciation Score:** {score}/10 {emoji_score}\n\n"
+        f"🗣 **You said:** {analysis.get('transcription')}\n"
+        f"_{analysis.get('transcription_romanized')}_\n\n"
+        f"💡 **Doctor's Feedback:**\n"
+        f"{analysis.get('feedback')}"
+    )
+
+# Telegram's limit for media captions
+CAPTION_LIMIT = 1024
+
+def merge_caption(caption, card):
+    """Caption + feedback card in one bubble when enabled and it fits, else None (send separately)."""
+    merged = f"{caption}\n\n{card}"
+    if MERGE_FEEDBACK_CAPTION and len(merged) <= CAPTION_LIMIT:
+        return merged
+    return None
+
+async def send_voice_reply(chat_id, tts_path, caption, card):
+    """
+    Sends the voice reply, with the feedback card in its caption when it fits.
+    Returns (sent message, caption used, card still to send as its own message or None).
+    """
+    merged = merge_caption(caption, card)
+    if merged:
+        try:
+            sent = await outbox.send(
+                chat_id, "send_voice", voice=Path(tts_path), caption=merged, parse_mode=constants.ParseMode.MARKDOWN
+            )
+            return sent, merged, None
+        except BadRequest as e:
+            # Gemini's free-text feedback can break legacy Markdown; don't let it sink the voice reply
+            logger.warning(f"Merged caption rejected ({e}), sending the feedback card separately")
+    sent = await outbox.send(
+        chat_id, "send_voice", voice=Path(tts_path), caption=caption, parse_mode=constants.ParseMode.MARKDOWN
+    )
+    return sent, caption, card
+
+def reminder_day():
+    return datetime.now(ZoneInfo(REMINDER_TIMEZONE)).date().isoformat()
+
+async def send_daily_reminders(context: ContextTypes.DEFAULT_TYPE):
+    """JobQueue callback: starts (or resumes) today's reminder fan-out in the background."""
+    task = context.bot_data.get("reminder_task")
+    if task and not task.done():
+        logger.info("Reminder run already in progress")
+        return
+
+    async def run():
+        try:
+            await reminder_service.run(reminder_day())
+        except asyncio.CancelledError:
+            logger.info("Reminder run interrupted; it will resume from the last finished batch")
+            raise
+        except Exception as e:
+            logger.error(f"Reminder run failed (will resume on next start/schedule): {e}", exc_info=True)
+
+    # Not awaited here so a long fan-out never holds up JobQueue shutdown (cancelled in post_stop)
+    context.bot_data["reminder_task"] = asyncio.create_task(run())
 
 async def ping(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Simple connection test."""
     logger.info(f"PING received from {update.effective_user.first_name}")
-    await context.bot.send_message(chat_id=update.effective_chat.id, text="🏓 Pong! El bot te escucha.")
+    await outbox.send(update.effective_chat.id, "send_message", text="🏓 Pong! El bot te escucha.")
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Sends a welcome message and the FIRST LESSON."""
     user = update.effective_user
     # Non-blocking DB update
-    asyncio.create_task(asyncio.to_thread(db_service.update_user, user.id, user.username, user.first_name))
+    spawn(db_service.aupdate_user(user.id, user.username, user.first_name))
     
     # 1. Welcome Text
     welcome_text = (
@@ -47,7 +267,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "🎯 **Lección 1: El Saludo**\n"
         "Escucha mi audio y **repite conmigo**:"
     )
-    await context.bot.send_message(chat_id=update.effective_chat.id, text=welcome_text)
+    await outbox.send(update.effective_chat.id, "send_message", text=welcome_text)
     
     # 2. First Lesson Audio (Proactive teaching)
     first_lesson_text = "안녕하세요" # Annyeonghaseyo
@@ -62,16 +282,16 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         tts_path = await audio_service.generate_tts(first_lesson_text, output_file=tts_filename)
-        await context.bot.send_voice(
-            chat_id=update.effective_chat.id, 
-            voice=open(tts_path, 'rb'),
+        await outbox.send(
+            update.effective_chat.id, "send_voice",
+            voice=Path(tts_path),
             caption=lesson_caption,
             parse_mode=constants.ParseMode.MARKDOWN
         )
         
         # 3. Instruction
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id, 
+        await outbox.send(
+            update.effective_chat.id, "send_message",
             text="🗣 Graba una nota de voz diciendo: **Annyeonghaseyo**"
         )
         # Cleanup
@@ -79,9 +299,116 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     except Exception as e:
         logger.error(f"Error sending first lesson: {e}")
-        await context.bot.send_message(chat_id=update.effective_chat.id, text="⚠️ Error generando audio de lección.")
+        await outbox.send(update.effective_chat.id, "send_message", text="⚠️ Error generando audio de lección.")
 
-async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Shows the user's materialized progress (single-row read, no history scan)."""
+    user = update.effective_user
+    record = await db_service.aget_progress(user.id)
+
+    lesson = get_lesson(record["lesson_index"])
+    if lesson:
+        number, romanized, hangul, spanish = lesson
+        lesson_line = f"🎯 **Lección {number}/{len(LESSONS)}:** {hangul} ({romanized}) - {spanish}"
+    else:
+        lesson_line = "🏆 **¡Currículo completado!** Modo conversación libre."
+
+    text = (
+        f"📈 **Tu progreso**\n\n"
+        f"{lesson_line}\n"
+        f"🗣 Intentos evaluados: {record['total_attempts']}\n"
+    )
+    weak = weak_phrases(record)
+    if weak:
+        text += "\n🔁 **Para repasar:**\n"
+        for phrase, stats in weak:
+            text += f"- {phrase}: {stats['last']}/10 (mejor {stats['best']}, {stats['attempts']} intentos)\n"
+
+    await outbox.send(
+        update.effective_chat.id, "send_message",
+        text=text,
+        parse_mode=constants.ParseMode.MARKDOWN
+    )
+
+async def usage(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Shows today's Gemini token usage for the user (and the daily budget, if any)."""
+    today = usage_tracker.user_today(update.effective_user.id)
+    sections = ", ".join(f"{name} {tokens}" for name, tokens in sorted(today["sections"].items()))
+    budget = f"{DAILY_TOKEN_BUDGET}" if DAILY_TOKEN_BUDGET else "sin límite"
+    text = (
+        f"🧮 **Uso de hoy**\n"
+        f"Llamadas: {today['calls']}\n"
+        f"Tokens: {today['total']} / {budget}\n"
+        f"Entrada {today['input']} (audio {today['audio']}, caché {today['cached']}) · Salida {today['output']}\n"
+        f"Por sección: {sections or '-'}"
+    )
+    await outbox.send(
+        update.effective_chat.id, "send_message",
+        text=text,
+        parse_mode=constants.ParseMode.MARKDOWN
+    )
+
+def build_partial_card(index, total, part):
+    """Short plain-text card for one analyzed segment of a long voice note."""
+    return (
+        f"🧩 Parte {index}/{total} · {part.get('pronunciation_score', '?')}/10\n"
+        f"🗣 {part.get('transcription')}"
+    )
+
+async def claim_cached_reply(key, leading):
+    """
+    Dedupe step: returns the finished reply for `key` (cached, or awaited from the
+    duplicate already in flight), or None after adding `key` to the keys this turn leads.
+    """
+    state, value = analysis_cache.claim(key)
+    if state == "lead":
+        leading.append(key)
+        return None
+    entry = value if state == "hit" else await value
+    # Keys this turn already leads get the same answer
+    if leading:
+        analysis_cache.resolve(leading, entry)
+        leading.clear()
+    return entry
+
+async def send_cached_reply(chat_id, entry):
+    """Resends an earlier reply: audio by Telegram file_id, no download/Gemini/TTS."""
+    logger.info(f"Duplicate voice note in chat {chat_id}, reusing previous reply")
+    if entry.get("voice_file_id"):
+        await outbox.send(
+            chat_id, "send_voice",
+            voice=entry["voice_file_id"],
+            caption=entry["caption"],
+            parse_mode=constants.ParseMode.MARKDOWN
+        )
+    elif entry.get("caption"):
+        # No reusable audio (e.g. the send returned no voice): the caption still carries the reply
+        await outbox.send(chat_id, "send_message", text=entry["caption"], parse_mode=constants.ParseMode.MARKDOWN)
+    if entry.get("text"):
+        await outbox.send(chat_id, "send_message", text=entry["text"], parse_mode=constants.ParseMode.MARKDOWN)
+
+async def prescore_lesson_attempt(audio_path, progress):
+    """
+    Local MFCC+DTW score of a voice note against the reference TTS of the user's
+    current lesson. Returns (score, decision) or None when the lesson has no fixed
+    phrase or scoring failed (the Gemini path is then used as before).
+    """
+    phrase = reference_text(progress["lesson_index"])
+    if not phrase:
+        return None
+    try:
+        score, distance = await audio_service.prescore(
+            audio_path, phrase, good_distance=PRESCORE_DISTANCE_GOOD, bad_distance=PRESCORE_DISTANCE_BAD
+        )
+    except Exception as e:
+        logger.warning(f"Pre-scoring failed, using Gemini only: {e}")
+        return None
+    decision = audio_service.classify_prescore(score, PRESCORE_PASS_SCORE, PRESCORE_FAIL_SCORE)
+    logger.info(f"Pre-score for '{phrase}': {score}/10 (DTW {distance:.3f}) -> {decision}")
+    return score, decision
+
+@governed
+async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE, mode=LoadMode.NORMAL):
     """Main pipeline: Audio In -> Gemini Analysis -> Audio/Text Out."""
     user = update.message.from_user
     chat_id = update.effective_chat.id
@@ -89,78 +416,154 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"Received voice note from {user.first_name} (ID: {user.id})")
 
     # Update User Profile in DB (Background Task)
-    asyncio.create_task(asyncio.to_thread(db_service.update_user, user.id, user.username, user.first_name))
+    spawn(db_service.aupdate_user(user.id, user.username, user.first_name))
     
     # Files to cleanup
     temp_files = []
     gemini_file = None
+    prescore_task = None
+
+    # 1. Notify user "Recording/Typing" (UX) - refreshed on a timer until the reply goes out
+    chat_action = outbox.keep_chat_action(chat_id, constants.ChatAction.RECORD_VOICE)
+    # Dedupe keys this turn leads; resolved with the reply (or abandoned on error)
+    dedupe_keys = []
 
     try:
-        # 1. Notify user "Recording/Typing" (UX)
-        await context.bot.send_chat_action(chat_id=chat_id, action=constants.ChatAction.RECORD_VOICE)
+        # 1b. Same voice note already answered (or being answered) for this user?
+        cached = await claim_cached_reply(("file", user.id, update.message.voice.file_unique_id), dedupe_keys)
+        if cached:
+            chat_action.stop()
+            await send_cached_reply(chat_id, cached)
+            return
 
-        # 2. Download Voice Note
+        # 2. Download Voice Note (into memory, on the download pool)
         voice_file = await context.bot.get_file(update.message.voice.file_id)
         ogg_path = f"voice_{user.id}_{update.message.message_id}.ogg"
-        await voice_file.download_to_drive(ogg_path)
-        temp_files.append(ogg_path)
+        ogg_data = await file_downloader.download(voice_file.file_path)
+
+        # 2b. Same audio under a different file_unique_id (e.g. re-uploaded): match by content hash
+        cached = await claim_cached_reply(("sha", user.id, content_digest(ogg_data)), dedupe_keys)
+        if cached:
+            chat_action.stop()
+            await send_cached_reply(chat_id, cached)
+            return
         
-        # 3. Convert to MP3
-        mp3_path = audio_service.convert_ogg_to_mp3(ogg_path)
+        # 3. Convert to MP3 (decoded straight from the downloaded bytes; ffmpeg runs off the event loop)
+        mp3_path = await asyncio.to_thread(audio_service.convert_ogg_to_mp3, ogg_path, ogg_data)
         temp_files.append(mp3_path)
 
-        # 4. Upload to Gemini
-        gemini_file = await gemini_service.upload_audio(mp3_path)
+        # 3b. Long notes are split at pauses and analyzed in parallel (skipped when degraded)
+        segments = []
+        if update.message.voice.duration > LONG_VOICE_SECONDS and mode == LoadMode.NORMAL:
+            segments = await asyncio.to_thread(audio_service.split_on_silence, mp3_path, SEGMENT_MAX_SECONDS * 1000)
+            temp_files.extend(path for path, _ in segments if path != mp3_path)
+            if len(segments) < 2:
+                segments = []
+
+        # [DB] Materialized progress (current lesson) - Async pooled client
+        user_progress = await db_service.aget_progress(user.id)
 
-        # [DB] Retrieve Context (Deep Memory) - Non-blocking
-        previous_context = await asyncio.to_thread(db_service.get_context, user.id, limit=50)
+        # 4. Local pre-score of short lesson attempts against the lesson's reference TTS.
+        # "on": a clear pass skips Gemini, a clear fail gets a cheaper call; "shadow": metrics only.
+        prescore = None
+        if (PRESCORE_MODE != "off" and not segments and mode == LoadMode.NORMAL
+                and update.message.voice.duration <= PRESCORE_MAX_SECONDS):
+            if PRESCORE_MODE == "on":
+                prescore = await prescore_lesson_attempt(mp3_path, user_progress)
+            else:
+                # Shadow: only compared with Gemini's score afterwards, so it runs alongside the upload
+                prescore_task = asyncio.create_task(prescore_lesson_attempt(mp3_path, user_progress))
+        enforce = prescore is not None and PRESCORE_MODE == "on"
+
+        # [DB] Retrieve Context (Recent turns) - Async pooled client
+        # (Under load, or for a clear local fail, the history window shrinks; progress still carries long-term state)
+        history_limit = load_governor.history_limit(mode, HISTORY_LIMIT, LOAD_REDUCED_HISTORY)
+        if enforce and prescore[1] == "fail":
+            history_limit = min(history_limit, LOAD_REDUCED_HISTORY)
+        previous_context = await db_service.aget_context(user.id, limit=history_limit)
         logger.info(f"Retrieved {len(previous_context)} context items for user {user.id}")
-        
-        # 5. Get Analysis from Gemini (Non-blocking internal)
+
         # Keep "typing" status alive during AI processing
-        await context.bot.send_chat_action(chat_id=chat_id, action=constants.ChatAction.TYPING)
-        
-        analysis = await gemini_service.analyze_audio(gemini_file, history=previous_context)
+        chat_action.switch(constants.ChatAction.TYPING)
+
+        if enforce and prescore[1] == "pass":
+            # Clear pass: answer locally (praise + next lesson), no upload or Gemini call
+            analysis = local_pass_analysis(user_progress["lesson_index"], prescore[0])
+        else:
+            # 5. Upload to Gemini (segments are uploaded by analyze_long_audio)
+            if not segments:
+                gemini_file = await gemini_service.upload_audio(mp3_path)
+
+            async def send_partial(index, total, part):
+                # Progressive feedback while the remaining segments are still being analyzed
+                await outbox.send(chat_id, "send_message", text=build_partial_card(index, total, part))
+
+            # Get Analysis from Gemini (Non-blocking internal)
+            with load_governor.timed():
+                if segments:
+                    analysis = await gemini_service.analyze_long_audio(
+                        segments,
+                        history=previous_context,
+                        progress=user_progress,
+                        user_id=user.id,
+                        on_segment=send_partial
+                    )
+                else:
+                    analysis = await gemini_service.analyze_audio(
+                        gemini_file,
+                        history=previous_context,
+                        progress=user_progress,
+                        user_id=user.id,
+                        audio_seconds=update.message.voice.duration
+                    )
+            if prescore_task:
+                prescore = await prescore_task
+            if prescore:
+                audio_service.record_prescore_agreement(prescore[0], analysis.get("pronunciation_score"), PASS_SCORE)
         
         # [DB] Save User Interaction - Non-blocking background
-        asyncio.create_task(asyncio.to_thread(
-            db_service.save_interaction,
+        spawn(db_service.asave_interaction(
             user_id=user.id, 
             role='user', 
             audio_path=ogg_path, 
             analysis_data=analysis
         ))
         
-        # 6. Generate TTS for the reply
         reply_text = analysis.get("reply_text", "Could not generate reply.")
+
+        if mode >= LoadMode.TEXT_ONLY:
+            # Degraded: skip TTS, one text bubble with reply + feedback
+            spawn(db_service.asave_interaction(
+                user_id=user.id,
+                role='model',
+                content_text=reply_text,
+                analysis_data={"feedback": analysis.get("feedback")}
+            ))
+            degraded_text = f"{build_reply_caption(analysis)}\n\n{build_feedback_card(analysis)}"
+            chat_action.stop()
+            await outbox.send(
+                chat_id, "send_message",
+                text=degraded_text,
+                parse_mode=constants.ParseMode.MARKDOWN
+            )
+            analysis_cache.resolve(dedupe_keys, {"voice_file_id": None, "caption": None, "text": degraded_text})
+            return
+
+        # 6. Generate TTS for the reply
         tts_filename = f"reply_{user.id}_{update.message.message_id}.mp3"
         tts_path = await audio_service.generate_tts(reply_text, output_file=tts_filename)
         temp_files.append(tts_path)
 
         # 7. Send Response - Audio Reply + Caption (Unified Bubble)
-        # Construct Caption:
-        # 🇰🇷 [Hangul]
-        # 🔤 [Romanization]
-        # 📖 [Phonetic-ES]
-        # 🇪🇸 [Translation]
-        # Feature B: Blind Training - Hide Korean/Romanization to force listening
-        caption_text = (
-            f"🇰🇷 ||{analysis.get('reply_text')}||\n"
-            f"🔤 ||{analysis.get('reply_romanized', '')}||\n"
-            f"📖 *{analysis.get('reply_phonetic_es', 'No phonetic')}*\n"
-            f"🇪🇸 {analysis.get('reply_translation', 'Trad: ???')}"
-        )
+        # The feedback card rides along in the caption when it fits (one call instead of two)
+        caption_text = build_reply_caption(analysis)
+        feedback_msg = build_feedback_card(analysis)
 
-        await context.bot.send_voice(
-            chat_id=chat_id, 
-            voice=open(tts_path, 'rb'),
-            caption=caption_text,
-            parse_mode=constants.ParseMode.MARKDOWN
-        )
+        chat_action.stop()
+        sent, sent_caption, separate_card = await send_voice_reply(chat_id, tts_path, caption_text, feedback_msg)
 
         # [DB] Save Model Reply - Non-blocking
-        asyncio.create_task(asyncio.to_thread(
-            db_service.save_interaction,
+        spawn(db_service.asave_interaction(
             user_id=user.id,
             role='model',
             content_text=reply_text,
@@ -168,133 +571,260 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ))
 
         # 9. Send Response - Step C: Feedback Card
-        score = analysis.get("pronunciation_score", "?")
-        emoji_score = "🟢" if int(score) >= 9 else "🟡" if int(score) >= 7 else "🔴"
-        
-        feedback_msg = (
-            f"📊 **Pronunciation Score:** {score}/10 {emoji_score}\n\n"
-            f"🗣 **You said:** {analysis.get('transcription')}\n"
-            f"_{analysis.get('transcription_romanized')}_\n\n"
-            f"💡 **Doctor's Feedback:**\n"
-            f"{analysis.get('feedback')}"
-        )
-        
-        await context.bot.send_message(
-            chat_id=chat_id, 
-            text=feedback_msg, 
-            parse_mode=constants.ParseMode.MARKDOWN
-        )
+        if separate_card:
+            await outbox.send(
+                chat_id, "send_message",
+                text=separate_card,
+                parse_mode=constants.ParseMode.MARKDOWN
+            )
+
+        # Duplicates of this note now reuse the uploaded reply audio by file_id
+        analysis_cache.resolve(dedupe_keys, {
+            "voice_file_id": sent.voice.file_id if sent and sent.voice else None,
+            "caption": sent_caption,
+            "text": separate_card
+        })
 
     except Exception as e:
         logger.error(f"Error in handle_voice: {e}", exc_info=True)
-        await context.bot.send_message(
-            chat_id=chat_id, 
+        analysis_cache.abandon(dedupe_keys, e)
+        chat_action.stop()
+        await outbox.send(
+            chat_id, "send_message",
             text="⚠️ An error occurred while processing your voice. Please try again or check if the file is too short."
         )
     finally:
+        chat_action.stop()
+        if prescore_task and not prescore_task.done():
+            # Gemini failed before the shadow score was needed; it reads a file about to be removed
+            prescore_task.cancel()
+        # No-op if resolved above; otherwise (e.g. cancelled) don't leave joiners waiting
+        analysis_cache.abandon(dedupe_keys, RuntimeError("Voice turn ended without a reply"))
         # Cleanup
         audio_service.cleanup_files(*temp_files)
         if gemini_file:
-            gemini_service.cleanup_gemini_file(gemini_file)
+            # Blocking HTTP call: keep it off the loop so other lanes aren't stalled
+            await asyncio.to_thread(gemini_service.cleanup_gemini_file, gemini_file)
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Entry point for TEXT input: bursts of short messages are debounced into one turn."""
+    user = update.message.from_user
+    logger.info(f"Received TEXT from {user.first_name}: {update.message.text}")
+
+    if TEXT_DEBOUNCE_SECONDS <= 0:
+        await process_text(update, context, update.message.text)
+        return
+    # Acknowledged only once the merged batch has been processed
+    update_queue.defer(update.update_id)
+    await text_coalescer.add(user.id, (update, context))
+
+async def flush_text_batch(user_id, items):
+    """Coalescer callback: merges the buffered messages and runs the pipeline once."""
+    update, context = items[-1]
+    merged_text = "\n".join(u.message.text for u, _ in items)
+    try:
+        # Runs after the update's handler returned, so take a text-lane slot here
+        async with lane_scheduler.slot("text"):
+            await process_text(update, context, merged_text)
+    finally:
+        update_queue.complete(*(u.update_id for u, _ in items))
+
+text_coalescer = MessageCoalescer(
+    flush_text_batch,
+    window=TEXT_DEBOUNCE_SECONDS,
+    max_wait=TEXT_DEBOUNCE_MAX_WAIT
+)
+
+@governed
+async def process_text(update: Update, context: ContextTypes.DEFAULT_TYPE, user_text: str, mode=LoadMode.NORMAL):
     """Pipeline for TEXT input (e.g. 'Necesito decir...')."""
     user = update.message.from_user
     chat_id = update.effective_chat.id
-    user_text = update.message.text
-    
-    logger.info(f"Received TEXT from {user.first_name}: {user_text}")
 
     # Update User Profile in DB - Non-blocking
-    asyncio.create_task(asyncio.to_thread(db_service.update_user, user.id, user.username, user.first_name))
+    spawn(db_service.aupdate_user(user.id, user.username, user.first_name))
     
     # Files to cleanup
     temp_files = []
 
+    # Keep "typing" status alive during DB + AI processing
+    chat_action = outbox.keep_chat_action(chat_id, constants.ChatAction.TYPING)
+
     try:
-        # [DB] Retrieve Context (Deep Memory) - Non-blocking
-        previous_context = await asyncio.to_thread(db_service.get_context, user.id, limit=50)
-        
-        # Keep "typing" status alive during AI processing
-        await context.bot.send_chat_action(chat_id=chat_id, action=constants.ChatAction.TYPING)
+        # [DB] Retrieve Context (Recent turns + materialized progress) - Async pooled client
+        history_limit = load_governor.history_limit(mode, HISTORY_LIMIT, LOAD_REDUCED_HISTORY)
+        previous_context = await db_service.aget_context(user.id, limit=history_limit)
+        user_progress = await db_service.aget_progress(user.id)
         
         # CALL GEMINI TEXT ANALYSIS (Internally non-blocking now)
-        analysis = await gemini_service.analyze_text(user_text, history=previous_context)
+        with load_governor.timed():
+            analysis = await gemini_service.analyze_text(
+                user_text, history=previous_context, progress=user_progress, user_id=user.id
+            )
         
         # [DB] Save User Interaction - Non-blocking
-        asyncio.create_task(asyncio.to_thread(
-            db_service.save_interaction,
+        spawn(db_service.asave_interaction(
             user_id=user.id, 
             role='user', 
             content_text=user_text,
             analysis_data={"transcription": user_text}
         ))
         
-        # Generate TTS for the reply
         reply_text = analysis.get("reply_text", "Could not generate reply.")
+
+        # Feedback Card (Simplified for Text)
+        feedback_msg = (
+            f"💡 **Tip:**\n"
+            f"{analysis.get('feedback')}"
+        )
+
+        if mode >= LoadMode.TEXT_ONLY:
+            # Degraded: skip TTS, one text bubble with reply + tip
+            spawn(db_service.asave_interaction(
+                user_id=user.id,
+                role='model',
+                content_text=reply_text,
+                analysis_data={"feedback": analysis.get("feedback")}
+            ))
+            chat_action.stop()
+            await outbox.send(
+                chat_id, "send_message",
+                text=f"{build_reply_caption(analysis)}\n\n{feedback_msg}",
+                parse_mode=constants.ParseMode.MARKDOWN
+            )
+            return
+
+        # Generate TTS for the reply
         tts_filename = f"reply_text_{user.id}_{update.message.message_id}.mp3"
         tts_path = await audio_service.generate_tts(reply_text, output_file=tts_filename)
         temp_files.append(tts_path)
 
-        # Send Response - Audio Reply + Caption
-        # Feature B: Blind Training - Hide Korean/Romanization
-        caption_text = (
-            f"🇰🇷 ||{analysis.get('reply_text')}||\n"
-            f"🔤 ||{analysis.get('reply_romanized', '')}||\n"
-            f"📖 *{analysis.get('reply_phonetic_es', 'No phonetic')}*\n"
-            f"🇪🇸 {analysis.get('reply_translation', 'Trad: ???')}"
-        )
+        # Send Response - Audio Reply + Caption (+ tip when it fits)
+        caption_text = build_reply_caption(analysis)
 
-        await context.bot.send_voice(
-            chat_id=chat_id, 
-            voice=open(tts_path, 'rb'),
-            caption=caption_text,
-            parse_mode=constants.ParseMode.MARKDOWN
-        )
+        chat_action.stop()
+        _, _, separate_card = await send_voice_reply(chat_id, tts_path, caption_text, feedback_msg)
 
         # [DB] Save Model Reply - Non-blocking
-        asyncio.create_task(asyncio.to_thread(
-            db_service.save_interaction,
+        spawn(db_service.asave_interaction(
             user_id=user.id,
             role='model',
             content_text=reply_text,
             analysis_data={"feedback": analysis.get("feedback")}
         ))
 
-        # Feedback Card (Simplified for Text)
-        feedback_msg = (
-            f"💡 **Tip:**\n"
-            f"{analysis.get('feedback')}"
-        )
-        
-        await context.bot.send_message(
-            chat_id=chat_id, 
-            text=feedback_msg, 
-            parse_mode=constants.ParseMode.MARKDOWN
-        )
+        if separate_card:
+            await outbox.send(
+                chat_id, "send_message",
+                text=separate_card,
+                parse_mode=constants.ParseMode.MARKDOWN
+            )
 
     except Exception as e:
         logger.error(f"Error in handle_text: {e}", exc_info=True)
-        await context.bot.send_message(chat_id=chat_id, text="⚠️ Error processing text.")
+        chat_action.stop()
+        await outbox.send(chat_id, "send_message", text="⚠️ Error processing text.")
     finally:
+        chat_action.stop()
         audio_service.cleanup_files(*temp_files)
 
 if __name__ == '__main__':
     # Conflict Resolution: Clear any existing webhook before polling
     # This prevents the 'Conflict: terminated by other getUpdates request' if switching from Cloud to Local
+    # Pending updates are kept (both by Telegram and in our local journal) so restarts don't lose voice notes
     async def post_init(app: ApplicationBuilder):
-        await app.bot.delete_webhook(drop_pending_updates=True)
+        await app.bot.delete_webhook(drop_pending_updates=False)
         logger.info("Webhook deleted to allow local polling.")
 
-    application = ApplicationBuilder().token(TELEGRAM_TOKEN).post_init(post_init).build()
+        # Start the outbound scheduler before anything (including replays) can send
+        outbox.start(app.bot)
+        # Lets the admin /admin/tasks endpoint (Flask thread) snapshot this loop's tasks
+        diagnostics.register_loop(asyncio.get_running_loop())
+
+        # Drain whatever was persisted but not acknowledged before the last stop/crash
+        # (through the update processor, so replayed voice notes respect the lane limits too)
+        async def replay(payload):
+            update = Update.de_json(payload, app.bot)
+            await app.update_processor.process_update(update, app.process_update(update))
+        spawn(update_queue.drain(replay, workers=UPDATE_QUEUE_WORKERS))
+
+        # Resume a reminder run that a restart interrupted today
+        state = reminder_service.state.data
+        if REMINDERS_ENABLED and state["day"] == reminder_day() and not state["done"]:
+            app.job_queue.run_once(send_daily_reminders, when=30, name="resume_reminders")
+
+        # Keep the SYSTEM_PROMPT context cache refreshed ahead of its TTL (cancelled in post_stop)
+        if gemini_service.prompt_cache:
+            app.bot_data["prompt_cache_task"] = asyncio.create_task(gemini_service.prompt_cache.keep_warm())
+
+    async def post_stop(app: ApplicationBuilder):
+        for name in ("prompt_cache_task", "reminder_task"):
+            if name in app.bot_data:
+                app.bot_data.pop(name).cancel()
+        # Graceful shutdown: bot is still usable here, so finish in-flight jobs first
+        await text_coalescer.flush_all()
+        await update_queue.wait_idle(SHUTDOWN_GRACE_SECONDS)
+        if background_tasks:
+            await asyncio.wait(set(background_tasks), timeout=SHUTDOWN_GRACE_SECONDS)
+        # Deliver replies that are still queued behind rate limits
+        await outbox.close(SHUTDOWN_GRACE_SECONDS)
+
+    async def post_shutdown(app: ApplicationBuilder):
+        # Release the DB connection pool / writer thread and the download pool
+        await db_service.aclose()
+        await file_downloader.aclose()
+        update_queue.close()
+        if gemini_service.prompt_cache:
+            gemini_service.prompt_cache.close()
+
+    application = (
+        ApplicationBuilder().token(TELEGRAM_TOKEN)
+        # Separate pools: sends/uploads, long-poll getUpdates (downloads use file_downloader)
+        .request(TracedHTTPXRequest(
+            pool_name="send",
+            connection_pool_size=TELEGRAM_SEND_POOL_SIZE,
+            pool_timeout=TELEGRAM_POOL_TIMEOUT,
+            read_timeout=TELEGRAM_SEND_TIMEOUT,
+            write_timeout=TELEGRAM_UPLOAD_TIMEOUT
+        ))
+        .concurrent_updates(LaneUpdateProcessor(lane_scheduler))
+        .get_updates_request(TracedHTTPXRequest(
+            pool_name="poll",
+            connection_pool_size=TELEGRAM_POLL_POOL_SIZE,
+            read_timeout=TELEGRAM_POLL_TIMEOUT
+        ))
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    # Updates waiting to be dispatched (or queued in a lane) count towards the governor's queue depth
+    load_governor.queue_probe = lambda: application.update_queue.qsize() + lane_scheduler.waiting()
+
+    # Daily practice reminders (python-telegram-bot[job-queue])
+    if REMINDERS_ENABLED:
+        hour, minute = (int(part) for part in REMINDER_TIME.split(":"))
+        application.job_queue.run_daily(
+            send_daily_reminders,
+            time=dtime(hour, minute, tzinfo=ZoneInfo(REMINDER_TIMEZONE)),
+            name="daily_reminders"
+        )
     
     start_handler = CommandHandler('start', start)
     ping_handler = CommandHandler('ping', ping)
+    progress_handler = CommandHandler('progress', progress)
+    usage_handler = CommandHandler('usage', usage)
     voice_handler = MessageHandler(filters.VOICE, handle_voice)
     text_handler = MessageHandler(filters.TEXT & (~filters.COMMAND), handle_text)
     
+    # Durable journal: persist before handling (group -1), acknowledge after (group 99)
+    application.add_handler(TypeHandler(Update, journal_update), group=-1)
+    application.add_handler(TypeHandler(Update, ack_update), group=99)
+
     application.add_handler(start_handler)
     application.add_handler(ping_handler)
+    application.add_handler(progress_handler)
+    application.add_handler(usage_handler)
     application.add_handler(voice_handler)
     application.add_handler(text_handler)
     
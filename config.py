@@ -4,12 +4,14 @@ import sys
 from dotenv import load_dotenv
 import logging
 
+from services import tracing  # adds %(trace_id)s to every log record
+
 # Load environment variables from .env file
 load_dotenv()
 
 # Configure logging
 logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s',
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
@@ -21,7 +23,9 @@ os.environ["PATH"] += os.pathsep + "/opt/homebrew/bin"
 
 def validate_env():
     """Validates that required environment variables are set."""
-    required_vars = ["TELEGRAM_TOKEN", "GEMINI_API_KEY", "SUPABASE_URL", "SUPABASE_KEY"]
+    required_vars = ["TELEGRAM_TOKEN", "GEMINI_API_KEY"]
+    if DB_BACKEND == "supabase":
+        required_vars += ["SUPABASE_URL", "SUPABASE_KEY"]
     missing_vars = [var for var in required_vars if not os.getenv(var)]
     
     if missing_vars:
@@ -37,6 +41,128 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
+# Text debounce: messages from the same user within this window (seconds) are merged
+# into one Gemini turn. A batch is never held longer than TEXT_DEBOUNCE_MAX_WAIT. 0 disables.
+TEXT_DEBOUNCE_SECONDS = float(os.getenv("TEXT_DEBOUNCE_SECONDS", "1.5"))
+TEXT_DEBOUNCE_MAX_WAIT = float(os.getenv("TEXT_DEBOUNCE_MAX_WAIT", "5"))
+
+# Load shedding: thresholds for REDUCED_HISTORY, TEXT_ONLY and SHED modes.
+# Depth = requests in flight + updates queued; latency = decayed EWMA of Gemini calls (seconds).
+LOAD_DEPTH_THRESHOLDS = [int(v) for v in os.getenv("LOAD_DEPTH_THRESHOLDS", "6,12,24").split(",")]
+LOAD_LATENCY_THRESHOLDS = [float(v) for v in os.getenv("LOAD_LATENCY_THRESHOLDS", "8,15,30").split(",")]
+# Step down only when both signals are below this fraction of the current level's thresholds
+LOAD_RECOVERY_RATIO = float(os.getenv("LOAD_RECOVERY_RATIO", "0.7"))
+# History rows sent to Gemini once in REDUCED_HISTORY mode or worse
+LOAD_REDUCED_HISTORY = int(os.getenv("LOAD_REDUCED_HISTORY", "5"))
+
+# Request tracing: finished spans are appended here as JSON Lines (empty disables export).
+# The file is rotated at TRACE_EXPORT_MAX_MB, keeping TRACE_EXPORT_BACKUPS older files (spans.jsonl.1, ...).
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "spans.jsonl")
+TRACE_EXPORT_MAX_MB = float(os.getenv("TRACE_EXPORT_MAX_MB", "50"))
+TRACE_EXPORT_BACKUPS = int(os.getenv("TRACE_EXPORT_BACKUPS", "3"))
+tracing.configure(TRACE_EXPORT_PATH, max_bytes=int(TRACE_EXPORT_MAX_MB * 1024 * 1024), backups=TRACE_EXPORT_BACKUPS)
+
+# Durable local journal of incoming updates (replayed after a restart/crash)
+UPDATE_QUEUE_PATH = os.getenv("UPDATE_QUEUE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "database", "update_queue.db"))
+UPDATE_QUEUE_MAX_ATTEMPTS = int(os.getenv("UPDATE_QUEUE_MAX_ATTEMPTS", "3"))
+UPDATE_QUEUE_WORKERS = int(os.getenv("UPDATE_QUEUE_WORKERS", "4"))
+# How long graceful shutdown waits for in-flight handlers and background DB writes
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", "30"))
+
+# Per-user daily Gemini token budget (input + output). 0 = unlimited.
+DAILY_TOKEN_BUDGET = int(os.getenv("DAILY_TOKEN_BUDGET", "0"))
+
+# Explicit Gemini context cache for the static SYSTEM_PROMPT (falls back to plain system_instruction)
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", "3600"))
+# Refresh the handle this many seconds before it expires
+PROMPT_CACHE_REFRESH_MARGIN = int(os.getenv("PROMPT_CACHE_REFRESH_MARGIN", "300"))
+
+# Long voice notes: above LONG_VOICE_SECONDS they are split at pauses into segments of at most
+# SEGMENT_MAX_SECONDS, analyzed concurrently (SEGMENT_CONCURRENCY per user) with partial feedback.
+LONG_VOICE_SECONDS = int(os.getenv("LONG_VOICE_SECONDS", "45"))
+SEGMENT_MAX_SECONDS = int(os.getenv("SEGMENT_MAX_SECONDS", "30"))
+SEGMENT_CONCURRENCY = int(os.getenv("SEGMENT_CONCURRENCY", "3"))
+
+# Reply TTS engines in preference order ("edge", "gtts", "local" = offline tone for tests).
+# The healthiest engine goes first; if it hasn't answered after TTS_HEDGE_SECONDS the next one races it.
+TTS_ENGINES = [name for name in os.getenv("TTS_ENGINES", "edge,gtts").split(",") if name.strip()]
+TTS_HEDGE_SECONDS = float(os.getenv("TTS_HEDGE_SECONDS", "2.5"))
+# Backup engines idle this long are re-measured in the background (0 disables)
+TTS_PROBE_SECONDS = float(os.getenv("TTS_PROBE_SECONDS", "300"))
+
+# Outbound scheduler: token buckets for Telegram's flood limits (~30 msg/s overall, ~1 msg/s per chat)
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", "25"))
+OUTBOX_CHAT_RATE = float(os.getenv("OUTBOX_CHAT_RATE", "1"))
+OUTBOX_CHAT_BURST = int(os.getenv("OUTBOX_CHAT_BURST", "3"))
+# Put the feedback card in the voice caption when it fits in 1024 chars (one send instead of two)
+MERGE_FEEDBACK_CAPTION = os.getenv("MERGE_FEEDBACK_CAPTION", "true").lower() in ("1", "true", "yes")
+
+# Duplicate voice notes (same file_unique_id or same bytes, per user) reuse the reply for this long
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", "600"))
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "512"))
+
+# Local MFCC+DTW pre-scoring of lesson attempts against a reference TTS rendering.
+# "off", "shadow" (score + agreement metrics only) or "on" (clear pass skips Gemini, clear fail gets less history).
+# Keep "shadow" until benchmark_prescore.py shows good agreement with Gemini on real recordings.
+PRESCORE_MODE = os.getenv("PRESCORE_MODE", "shadow").lower()
+PRESCORE_MAX_SECONDS = int(os.getenv("PRESCORE_MAX_SECONDS", "10"))
+PRESCORE_PASS_SCORE = float(os.getenv("PRESCORE_PASS_SCORE", "8.5"))
+PRESCORE_FAIL_SCORE = float(os.getenv("PRESCORE_FAIL_SCORE", "3"))
+# Normalized DTW distance mapped to score 10 (good) and 0 (bad)
+PRESCORE_DISTANCE_GOOD = float(os.getenv("PRESCORE_DISTANCE_GOOD", "1.6"))
+PRESCORE_DISTANCE_BAD = float(os.getenv("PRESCORE_DISTANCE_BAD", "2.6"))
+
+# Daily practice reminders (JobQueue) for users inactive between REMINDER_INACTIVE_HOURS and
+# REMINDER_MAX_INACTIVE_DAYS. Sent at low priority and paced to REMINDER_RATE messages/second.
+REMINDERS_ENABLED = os.getenv("REMINDERS_ENABLED", "true").lower() in ("1", "true", "yes")
+REMINDER_TIME = os.getenv("REMINDER_TIME", "18:00")
+REMINDER_TIMEZONE = os.getenv("REMINDER_TIMEZONE", "UTC")
+REMINDER_INACTIVE_HOURS = int(os.getenv("REMINDER_INACTIVE_HOURS", "24"))
+REMINDER_MAX_INACTIVE_DAYS = int(os.getenv("REMINDER_MAX_INACTIVE_DAYS", "14"))
+REMINDER_RATE = float(os.getenv("REMINDER_RATE", "10"))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "50"))
+# Fan-out progress (cursor, counters, uploaded file_ids) so an interrupted run resumes
+REMINDER_STATE_PATH = os.getenv("REMINDER_STATE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "database", "reminders.json"))
+
+# Admin diagnostics on the keep-alive server (/admin/...): profiler, tracemalloc, fds, tasks.
+# Disabled unless ADMIN_TOKEN is set; results are also written to DIAGNOSTICS_DIR for download.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+DIAGNOSTICS_DIR = os.getenv("DIAGNOSTICS_DIR", "diagnostics")
+
+# Telegram HTTP pools: long-poll getUpdates, sends/uploads and file downloads each get their own
+# connections so a burst of voice uploads/downloads never stalls polling or short replies.
+TELEGRAM_POLL_POOL_SIZE = int(os.getenv("TELEGRAM_POLL_POOL_SIZE", "1"))
+TELEGRAM_POLL_TIMEOUT = float(os.getenv("TELEGRAM_POLL_TIMEOUT", "30"))
+TELEGRAM_SEND_POOL_SIZE = int(os.getenv("TELEGRAM_SEND_POOL_SIZE", "64"))
+TELEGRAM_SEND_TIMEOUT = float(os.getenv("TELEGRAM_SEND_TIMEOUT", "10"))
+TELEGRAM_UPLOAD_TIMEOUT = float(os.getenv("TELEGRAM_UPLOAD_TIMEOUT", "30"))
+TELEGRAM_DOWNLOAD_POOL_SIZE = int(os.getenv("TELEGRAM_DOWNLOAD_POOL_SIZE", "16"))
+TELEGRAM_DOWNLOAD_TIMEOUT = float(os.getenv("TELEGRAM_DOWNLOAD_TIMEOUT", "30"))
+# Max wait for a free connection before a call fails with TimedOut
+TELEGRAM_POOL_TIMEOUT = float(os.getenv("TELEGRAM_POOL_TIMEOUT", "5"))
+
+# Priority lanes for update handling: per-lane concurrency limits, fair-share weights and latency SLOs
+# (seconds). UPDATE_WORKERS is the total number of updates processed at once across all lanes.
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "16"))
+LANE_LIMITS = os.getenv("LANE_LIMITS", "interactive:8,text:8,voice:4")
+LANE_WEIGHTS = os.getenv("LANE_WEIGHTS", "interactive:4,text:2,voice:1")
+LANE_SLOS = os.getenv("LANE_SLOS", "interactive:1,text:10,voice:30")
+
+# Storage backend: "supabase" (cloud) or "sqlite" (local file using database/schema.sql)
+DB_BACKEND = os.getenv("DB_BACKEND", "supabase").lower()
+# Async Supabase client: HTTP/2 keep-alive pool size and max concurrent DB requests
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", "8"))
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "10"))
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "database", "kvoice.db"))
+
+# Recent turns sent to Gemini as conversation history.
+# Lesson index and weak phrases come from the user_progress record instead.
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "20"))
+# Progress records kept in memory (least recently active users are evicted and re-read on demand)
+PROGRESS_CACHE_SIZE = int(os.getenv("PROGRESS_CACHE_SIZE", "5000"))
+
 # Temporary storage for conversation history (state)
 # In production, use a database (Redis/Postgres)
 # Structure: {user_id: [{"role": "user", "parts": [...]}, ...]}
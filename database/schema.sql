@@ -26,5 +26,21 @@ CREATE TABLE IF NOT EXISTS interactions (
     FOREIGN KEY(user_id) REFERENCES users(user_id)
 );
 
+-- Index for selecting inactive users (practice reminders)
+CREATE INDEX IF NOT EXISTS idx_users_last_active ON users(last_active);
+
 -- Index for fast context retrieval (getting last N messages)
 CREATE INDEX IF NOT EXISTS idx_interactions_user_created ON interactions(user_id, created_at DESC);
+
+-- Index for the whole-table keyset export (ORDER BY created_at, id)
+CREATE INDEX IF NOT EXISTS idx_interactions_created_id ON interactions(created_at, id);
+
+-- Materialized learning progress (one row per user, updated incrementally on each graded interaction)
+CREATE TABLE IF NOT EXISTS user_progress (
+    user_id INTEGER PRIMARY KEY,
+    lesson_index INTEGER DEFAULT 0, -- 0-based index into the curriculum
+    phrase_stats TEXT DEFAULT '{}', -- JSON: {phrase: {"best": int, "last": int, "attempts": int}}
+    total_attempts INTEGER DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY(user_id) REFERENCES users(user_id)
+);
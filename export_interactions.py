@@ -0,0 +1,37 @@
+import argparse
+import json
+import sys
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.db_service import DBService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk export of interactions as JSON Lines (keyset-paginated).")
+    parser.add_argument("--user-id", type=int, default=None, help="Only export this user's interactions")
+    parser.add_argument("--out", default="-", help="Output file (default: stdout)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows fetched per page")
+    args = parser.parse_args()
+
+    db = DBService()
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+
+    start_time = time.time()
+    count = 0
+    try:
+        for row in db.iter_interactions(user_id=args.user_id, batch_size=args.batch_size):
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    duration = time.time() - start_time
+    print(f"✅ Exported {count} interactions in {duration:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,13 @@
-from flask import Flask
+from flask import Flask, Response, abort, jsonify, request, send_from_directory
 from threading import Thread
+import functools
+import hmac
+import json
 import logging
+import os
+
+from config import ADMIN_TOKEN, DIAGNOSTICS_DIR
+from services import diagnostics, metrics
 
 # Filter out Flask startup logs to keep console clean
 log = logging.getLogger('werkzeug')
@@ -12,7 +19,124 @@ app = Flask('')
 def home():
     return "I'm alive! 🤖 K-Voice Coach is running."
 
-import os
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus-format process metrics (DB pool, latencies, ...)."""
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+# --- Admin diagnostics (disabled unless ADMIN_TOKEN is set) ---
+
+def admin_only(view):
+    """Requires `Authorization: Bearer <ADMIN_TOKEN>` (or ?token=); 404 when admin is disabled."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            abort(404)
+        header = request.headers.get("Authorization", "")
+        token = header[7:] if header.startswith("Bearer ") else request.args.get("token", "")
+        if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            abort(401)
+        try:
+            return view(*args, **kwargs)
+        except RuntimeError as e:
+            return jsonify({"error": str(e)}), 409
+    return wrapper
+
+def saved(kind, data):
+    """Returns `data` as JSON and also keeps a copy in DIAGNOSTICS_DIR for download."""
+    os.makedirs(DIAGNOSTICS_DIR, exist_ok=True)
+    name = f"{kind}-{diagnostics._stamp()}.json"
+    with open(os.path.join(DIAGNOSTICS_DIR, name), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    return jsonify(dict(data, file=name))
+
+@app.route('/admin/profile/start', methods=['POST'])
+@admin_only
+def profile_start():
+    interval = float(request.args.get("interval", "0.01"))
+    diagnostics.profiler.start(interval)
+    return jsonify({"status": "profiling", "interval": interval})
+
+@app.route('/admin/profile/stop', methods=['POST'])
+@admin_only
+def profile_stop():
+    os.makedirs(DIAGNOSTICS_DIR, exist_ok=True)
+    return jsonify(diagnostics.profiler.stop(DIAGNOSTICS_DIR))
+
+@app.route('/admin/memory/start', methods=['POST'])
+@admin_only
+def memory_start():
+    frames = int(request.args.get("frames", "25"))
+    diagnostics.memory.start(frames)
+    return jsonify({"status": "tracing", "frames": frames, **diagnostics.process_memory()})
+
+@app.route('/admin/memory/stop', methods=['POST'])
+@admin_only
+def memory_stop():
+    diagnostics.memory.stop()
+    return jsonify({"status": "stopped"})
+
+@app.route('/admin/memory/top')
+@admin_only
+def memory_top():
+    data = diagnostics.memory.top(int(request.args.get("limit", "25")), request.args.get("key", "lineno"))
+    return saved("memory-top", dict(data, **diagnostics.process_memory()))
+
+@app.route('/admin/memory/diff')
+@admin_only
+def memory_diff():
+    data = diagnostics.memory.diff(
+        int(request.args.get("limit", "25")),
+        request.args.get("key", "lineno"),
+        reset=request.args.get("reset") == "1"
+    )
+    return saved("memory-diff", dict(data, **diagnostics.process_memory()))
+
+@app.route('/admin/memory/dump', methods=['POST'])
+@admin_only
+def memory_dump():
+    os.makedirs(DIAGNOSTICS_DIR, exist_ok=True)
+    return jsonify(diagnostics.memory.dump(DIAGNOSTICS_DIR))
+
+@app.route('/admin/fds')
+@admin_only
+def fds():
+    return saved("fds", diagnostics.open_fds())
+
+@app.route('/admin/tempfiles')
+@admin_only
+def tempfiles():
+    return saved("tempfiles", diagnostics.temp_files())
+
+@app.route('/admin/tasks')
+@admin_only
+def tasks():
+    return saved("tasks", diagnostics.asyncio_tasks())
+
+@app.route('/admin/status')
+@admin_only
+def status():
+    """Live service snapshots: lanes, DB pool, TTS engine health, token usage, reminder run."""
+    return jsonify(diagnostics.service_status())
+
+@app.route('/admin/status/<name>')
+@admin_only
+def status_one(name):
+    data = diagnostics.service_status([name])
+    if name not in data:
+        abort(404)
+    return jsonify(data[name])
+
+@app.route('/admin/files')
+@admin_only
+def files():
+    names = sorted(os.listdir(DIAGNOSTICS_DIR)) if os.path.isdir(DIAGNOSTICS_DIR) else []
+    return jsonify({"files": names})
+
+@app.route('/admin/files/<path:name>')
+@admin_only
+def download(name):
+    return send_from_directory(os.path.abspath(DIAGNOSTICS_DIR), name, as_attachment=True)
 
 def run():
     # Render assigns a random port in the PORT env var. We must use it.
@@ -0,0 +1,77 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+DEDUPE = metrics.counter("kvoice_analysis_dedupe_total", "Voice note lookups by result (hit/join/miss) and key kind (file/sha)")
+CACHE_SIZE = metrics.gauge("kvoice_analysis_cache_entries", "Finished analyses currently cached")
+
+
+def content_digest(data):
+    """SHA-256 of the audio bytes (fallback key when file_unique_id differs for the same audio)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Short-lived cache of finished voice-note replies with single-flight:
+    the first request for a key leads, concurrent duplicates await its result.
+    Keys are tuples like ("file", user_id, file_unique_id) or ("sha", user_id, digest);
+    they include the user because the reply depends on their history and progress.
+    """
+
+    def __init__(self, ttl=600, max_entries=512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> (expires_at, entry), oldest first
+        self._entries = OrderedDict()
+        # key -> Future resolved by the leader
+        self._inflight = {}
+
+    def claim(self, key):
+        """Returns ("hit", entry), ("join", awaitable) or ("lead", None); leaders must resolve() or abandon()."""
+        cached = self._entries.get(key)
+        if cached and cached[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            DEDUPE.inc(result="hit", key=key[0])
+            return "hit", cached[1]
+        if cached:
+            del self._entries[key]
+
+        future = self._inflight.get(key)
+        if future is not None:
+            DEDUPE.inc(result="join", key=key[0])
+            # shield: a joiner being cancelled must not cancel the leader's result
+            return "join", asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        # Failures with no joiners are fine; don't warn about unretrieved exceptions
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        DEDUPE.inc(result="miss", key=key[0])
+        return "lead", None
+
+    def resolve(self, keys, entry):
+        """Stores the leader's result under every key it claimed and wakes the joiners."""
+        expires_at = time.monotonic() + self.ttl
+        for key in keys:
+            self._entries[key] = (expires_at, entry)
+            self._entries.move_to_end(key)
+            future = self._inflight.pop(key, None)
+            if future and not future.done():
+                future.set_result(entry)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        CACHE_SIZE.set(len(self._entries))
+
+    def abandon(self, keys, error):
+        """Leader failed: joiners get the same error, nothing is cached."""
+        for key in keys:
+            future = self._inflight.pop(key, None)
+            if future and not future.done():
+                future.set_exception(error)
@@ -1,9 +1,17 @@
+import asyncio
+import io
 import logging
-import edge_tts
 import uuid
 import shutil
 import os
+import time
+import numpy as np
 from pydub import AudioSegment
+from pydub.silence import detect_silence
+
+from config import TTS_ENGINES, TTS_HEDGE_SECONDS, TTS_PROBE_SECONDS
+from services import metrics, tracing
+from services.tts_service import TTSService, build_engines
 
 # Initialize logger first
 logger = logging.getLogger(__name__)
@@ -64,11 +72,55 @@ if ffprobe_path:
 else:
     logger.warning("ffprobe not found!")
 
+tts_service = TTSService(build_engines(TTS_ENGINES), hedge_after=TTS_HEDGE_SECONDS, probe_interval=TTS_PROBE_SECONDS)
+
+PRESCORE_LATENCY = metrics.histogram("kvoice_prescore_seconds", "Local MFCC+DTW pre-scoring time (excluding reference TTS)")
+PRESCORE_DECISIONS = metrics.counter("kvoice_prescore_decisions_total", "Pre-score outcomes (pass/fail/unsure)")
+PRESCORE_ERROR = metrics.histogram("kvoice_prescore_abs_error", "|local score - Gemini pronunciation_score| when both ran")
+PRESCORE_AGREEMENT = metrics.counter("kvoice_prescore_agreement_total", "Whether local and Gemini scores agree on pass/fail")
+
+# MFCC front end: 16 kHz mono, 25 ms Hamming windows every 10 ms, 26 mel bands -> 13 coefficients
+SAMPLE_RATE = 16000
+FRAME_LEN = 400
+FRAME_HOP = 160
+N_FFT = 512
+N_MELS = 26
+N_MFCC = 13
+# Frames quieter than the loudest one by more than this are leading/trailing silence
+VAD_RANGE_DB = 40
+
+def _mel_filterbank():
+    """(N_MELS, N_FFT//2 + 1) triangular filters evenly spaced on the mel scale."""
+    def hz_to_mel(hz):
+        return 2595 * np.log10(1 + hz / 700)
+
+    def mel_to_hz(mel):
+        return 700 * (10 ** (mel / 2595) - 1)
+
+    mel_points = np.linspace(hz_to_mel(0), hz_to_mel(SAMPLE_RATE / 2), N_MELS + 2)
+    bins = np.floor((N_FFT + 1) * mel_to_hz(mel_points) / SAMPLE_RATE).astype(int)
+    freqs = np.arange(N_FFT // 2 + 1)[None, :]
+    left, center, right = bins[:-2, None], bins[1:-1, None], bins[2:, None]
+    rising = (freqs - left) / np.maximum(center - left, 1)
+    falling = (right - freqs) / np.maximum(right - center, 1)
+    return np.clip(np.minimum(rising, falling), 0, None)
+
+_MEL_FILTERS = _mel_filterbank()
+# Orthonormal DCT-II matrix (N_MELS -> N_MFCC)
+_DCT = np.sqrt(2 / N_MELS) * np.cos(np.pi / N_MELS * (np.arange(N_MELS)[None, :] + 0.5) * np.arange(N_MFCC)[:, None])
+_DCT[0] /= np.sqrt(2)
+_WINDOW = np.hamming(FRAME_LEN)
+
+# Reference phrase text -> MFCC matrix of its TTS rendering
+_reference_features = {}
+
 class AudioService:
     @staticmethod
-    def convert_ogg_to_mp3(ogg_path: str) -> str:
+    def convert_ogg_to_mp3(ogg_path: str, ogg_data: bytes = None) -> str:
         """
         Converts Telegram's OGG voice note to MP3 for Gemini.
+        With `ogg_data` the note is decoded from memory (piped to ffmpeg) and
+        `ogg_path` only names the output; nothing is read from disk.
         Returns the path to the MP3 file.
         """
         try:
@@ -81,8 +133,9 @@ class AudioService:
             
             # Load OGG and export as MP3
             # Requires FFmpeg installed on the system
-            audio = AudioSegment.from_ogg(ogg_path)
-            audio.export(mp3_path, format="mp3")
+            with tracing.span("audio.convert_ogg_to_mp3"):
+                audio = AudioSegment.from_ogg(io.BytesIO(ogg_data) if ogg_data is not None else ogg_path)
+                audio.export(mp3_path, format="mp3")
             
             logger.info(f"Converted {ogg_path} to {mp3_path}")
             return mp3_path
@@ -90,10 +143,50 @@ class AudioService:
             logger.error(f"Error converting audio: {e}")
             raise
 
+    @staticmethod
+    def split_on_silence(audio_path: str, max_segment_ms: int = 30000, min_silence_ms: int = 400,
+                         silence_offset_db: float = -16) -> list:
+        """
+        Splits a long recording into segments of at most max_segment_ms,
+        cutting in the middle of the last pause before each limit (hard cut if there is none).
+        Segments are exported one at a time next to the source file.
+        Returns [(segment_path, duration_ms), ...]; a single entry means no split was needed.
+        """
+        with tracing.span("audio.split_on_silence"):
+            audio = AudioSegment.from_file(audio_path)
+            if len(audio) <= max_segment_ms:
+                return [(audio_path, len(audio))]
+
+            # Candidate cut points: midpoints of pauses quieter than the clip's average loudness + offset
+            silences = detect_silence(audio, min_silence_len=min_silence_ms, silence_thresh=audio.dBFS + silence_offset_db)
+            cut_points = [(start + end) // 2 for start, end in silences]
+
+            bounds = []
+            start = 0
+            while len(audio) - start > max_segment_ms:
+                limit = start + max_segment_ms
+                # Prefer a pause in the second half of the window so segments stay reasonably long
+                candidates = [c for c in cut_points if start + max_segment_ms // 2 <= c <= limit]
+                end = candidates[-1] if candidates else limit
+                bounds.append((start, end))
+                start = end
+            bounds.append((start, len(audio)))
+
+            base, ext = os.path.splitext(audio_path)
+            segments = []
+            for i, (seg_start, seg_end) in enumerate(bounds):
+                seg_path = f"{base}_part{i + 1}{ext}"
+                audio[seg_start:seg_end].export(seg_path, format=ext.lstrip(".") or "mp3")
+                segments.append((seg_path, seg_end - seg_start))
+
+        logger.info(f"Split {audio_path} ({len(audio)} ms) into {len(segments)} segments")
+        return segments
+
     @staticmethod
     async def generate_tts(text: str, output_file: str = None) -> str:
         """
-        Generates Korean TTS audio using edge-tts.
+        Generates Korean TTS audio with the healthiest configured engine
+        (edge-tts by default), failing over / hedging to the others.
         Returns the path to the generated audio file.
         """
         if not output_file:
@@ -101,21 +194,116 @@ class AudioService:
             output_file = f"response_{uuid.uuid4()}.mp3"
         
         try:
-            # VOICE SELECTION:
-            # ko-KR-SunHiNeural (Female)
-            # ko-KR-InJoonNeural (Male)
-            voice = "ko-KR-SunHiNeural" 
-            
-            # Rate -20% for beginners
-            communicate = edge_tts.Communicate(text, voice, rate="-20%")
-            await communicate.save(output_file)
+            with tracing.span("audio.generate_tts", chars=len(text)) as span:
+                engine = await tts_service.synthesize(text, output_file)
+                span.set(engine=engine)
             
-            logger.info(f"Generated TTS audio at {output_file}")
+            logger.info(f"Generated TTS audio at {output_file} ({engine})")
             return output_file
         except Exception as e:
             logger.error(f"Error generating TTS: {e}")
             raise
 
+    @staticmethod
+    def load_samples(audio_path: str) -> np.ndarray:
+        """Decodes any ffmpeg-readable file to 16 kHz mono float samples in [-1, 1]."""
+        audio = AudioSegment.from_file(audio_path).set_channels(1).set_frame_rate(SAMPLE_RATE)
+        samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+        return samples / float(1 << (8 * audio.sample_width - 1))
+
+    @staticmethod
+    def mfcc(samples: np.ndarray) -> np.ndarray:
+        """
+        (frames, N_MFCC) MFCC matrix with leading/trailing silence trimmed and
+        per-utterance mean/variance normalization (removes mic and voice offsets).
+        """
+        emphasized = np.append(samples[:1], samples[1:] - 0.97 * samples[:-1])
+        if len(emphasized) < FRAME_LEN:
+            emphasized = np.pad(emphasized, (0, FRAME_LEN - len(emphasized)))
+        frames = np.lib.stride_tricks.sliding_window_view(emphasized, FRAME_LEN)[::FRAME_HOP] * _WINDOW
+        power = np.abs(np.fft.rfft(frames, N_FFT)) ** 2 / N_FFT
+
+        # Energy-based trim of silence around the utterance
+        energy_db = 10 * np.log10(power.sum(axis=1) + 1e-10)
+        voiced = np.flatnonzero(energy_db > energy_db.max() - VAD_RANGE_DB)
+        power = power[voiced[0]:voiced[-1] + 1]
+
+        features = np.log(power @ _MEL_FILTERS.T + 1e-10) @ _DCT.T
+        return (features - features.mean(axis=0)) / (features.std(axis=0) + 1e-8)
+
+    @staticmethod
+    def dtw_distance(a: np.ndarray, b: np.ndarray) -> float:
+        """
+        DTW alignment cost between two feature sequences, normalized by path length bound (n + m).
+        Each row is solved vectorized: the horizontal recurrence D[i,j] = min(t[j], D[i,j-1] + c[i,j])
+        is a prefix minimum over the row's cumulative cost.
+        """
+        sq = (a ** 2).sum(axis=1)[:, None] + (b ** 2).sum(axis=1)[None, :] - 2 * a @ b.T
+        cost = np.sqrt(np.maximum(sq, 0))
+
+        previous = np.cumsum(cost[0])
+        for row in cost[1:]:
+            diagonal_or_up = np.empty_like(row)
+            diagonal_or_up[0] = previous[0]
+            diagonal_or_up[1:] = np.minimum(previous[1:], previous[:-1])
+            cumulative = np.cumsum(row)
+            previous = cumulative + np.minimum.accumulate(row + diagonal_or_up - cumulative)
+        return float(previous[-1] / (len(a) + len(b)))
+
+    @staticmethod
+    async def reference_features(text: str) -> np.ndarray:
+        """MFCCs of the TTS pronunciation of `text` (synthesized once per process)."""
+        features = _reference_features.get(text)
+        if features is None:
+            tts_path = await AudioService.generate_tts(text, output_file=f"reference_{uuid.uuid4()}.mp3")
+            try:
+                samples = await asyncio.to_thread(AudioService.load_samples, tts_path)
+                features = _reference_features[text] = AudioService.mfcc(samples)
+            finally:
+                AudioService.cleanup_files(tts_path)
+        return features
+
+    @staticmethod
+    async def prescore(audio_path: str, reference_text: str, good_distance: float = 1.6, bad_distance: float = 2.6):
+        """
+        Provisional 0-10 pronunciation score of the learner's audio against the
+        reference TTS of `reference_text`: DTW distance <= good_distance maps to 10,
+        >= bad_distance to 0, linear in between. Returns (score, distance).
+        """
+        reference = await AudioService.reference_features(reference_text)
+        with tracing.span("audio.prescore") as span:
+            start = time.perf_counter()
+
+            def score_audio():
+                learner = AudioService.mfcc(AudioService.load_samples(audio_path))
+                return AudioService.dtw_distance(learner, reference)
+
+            distance = await asyncio.to_thread(score_audio)
+            score = float(np.clip(10 * (bad_distance - distance) / (bad_distance - good_distance), 0, 10))
+            PRESCORE_LATENCY.observe(time.perf_counter() - start)
+            span.set(distance=round(distance, 3), score=round(score, 1))
+        return round(score, 1), distance
+
+    @staticmethod
+    def classify_prescore(score: float, pass_score: float, fail_score: float) -> str:
+        """"pass" / "fail" when the provisional score is clearly on one side, else "unsure"."""
+        decision = "pass" if score >= pass_score else "fail" if score <= fail_score else "unsure"
+        PRESCORE_DECISIONS.inc(decision=decision)
+        return decision
+
+    @staticmethod
+    def record_prescore_agreement(local_score: float, gemini_score, pass_threshold: float):
+        """Compares the provisional score with Gemini's for calibration metrics."""
+        try:
+            gemini_score = int(gemini_score or 0)
+        except (TypeError, ValueError):
+            return
+        if gemini_score <= 0:
+            return
+        PRESCORE_ERROR.observe(abs(local_score - gemini_score))
+        agree = (local_score >= pass_threshold) == (gemini_score >= pass_threshold)
+        PRESCORE_AGREEMENT.inc(agree="yes" if agree else "no")
+
     @staticmethod
     def cleanup_files(*files):
         """Deletes temporary audio files."""
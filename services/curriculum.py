@@ -0,0 +1,155 @@
+"""
+Structured copy of the MASTER CURRICULUM embedded in SYSTEM_PROMPT.
+Used to track progress per user without asking Gemini to re-derive it.
+"""
+import re
+import unicodedata
+
+# Score at which a lesson counts as passed (mirrors the "Score >= 7" flow rule in SYSTEM_PROMPT)
+PASS_SCORE = 7
+
+# (romanized, hangul, spanish) - same order as the prompt
+LESSONS = [
+    # LEVEL 1: SURVIVAL & MANNERS
+    ("Annyeonghaseyo", "안녕하세요", "Hola"),
+    ("Ne / Aniyo", "네 / 아니요", "Sí / No"),
+    ("Gamsahamnida", "감사합니다", "Gracias"),
+    ("Joesonghamnida", "죄송합니다", "Lo siento"),
+    ("Jeogiyo", "저기요", "Disculpe"),
+    ("Annyeonghi gyeseyo", "안녕히 계세요", "Adiós (al que se queda)"),
+    ("Annyeonghi gaseyo", "안녕히 가세요", "Adiós (al que se va)"),
+    # LEVEL 2: BASIC INTRO & IDENTITY
+    ("Jeoneun ... imnida", "저는 ... 입니다", "Yo soy ..."),
+    ("Bangapseumnida", "반갑습니다", "Mucho gusto"),
+    ("eun / neun", "은 / 는", "Partícula de tema"),
+    ("Igeo mwoyeyo?", "이거 뭐예요?", "¿Qué es esto?"),
+    ("Igeoseun ... yeyo", "이것은 ... 예요", "Esto es ..."),
+    # LEVEL 3: SURVIVAL SKILLS
+    ("... juseyo", "... 주세요", "Deme ..., por favor"),
+    ("Hana, dul, set, net, daseot", "하나, 둘, 셋, 넷, 다섯", "Números nativos 1-5"),
+    ("Il, i, sam, sa, o", "일, 이, 삼, 사, 오", "Números sino-coreanos"),
+    ("Eolmayeyo?", "얼마예요?", "¿Cuánto cuesta?"),
+    ("Hwajangsil eodiyeyo?", "화장실 어디예요?", "¿Dónde está el baño?"),
+    # LEVEL 4: DAILY ROUTINE (Verbs)
+    ("Gayo", "가요", "Voy"),
+    ("Meogeoyo", "먹어요", "Como"),
+    ("Haeyo", "해요", "Hago"),
+    ("Gasseoyo / Meogeosseoyo", "갔어요 / 먹었어요", "Fui / Comí"),
+    # LEVEL 5: FEELINGS & OPINIONS
+    ("Joayo", "좋아요", "Me gusta"),
+    ("Masisseoyo", "맛있어요", "Está delicioso"),
+    ("Bappayo", "바빠요", "Estoy ocupado"),
+    ("Hago sipeoyo", "하고 싶어요", "Quiero hacer ..."),
+    # LEVEL 6: FLUENCY CONNECTORS
+    ("Hago / Rang", "하고 / 랑", "Y / con"),
+    ("Hajiman / Geunde", "하지만 / 근데", "Pero"),
+    ("Geuraeseo", "그래서", "Por eso"),
+    ("Wae-nyahamyeon", "왜냐하면", "Porque"),
+]
+
+
+def get_lesson(index: int):
+    """Returns (number, romanized, hangul, spanish) or None once the curriculum is finished."""
+    if index is None or index < 0 or index >= len(LESSONS):
+        return None
+    romanized, hangul, spanish = LESSONS[index]
+    return index + 1, romanized, hangul, spanish
+
+
+def normalize_phrase(text):
+    """Lowercase, NFC, letters/digits only (drops spaces, punctuation and hyphens)."""
+    text = unicodedata.normalize("NFC", text or "").lower()
+    return re.sub(r"[\W_]+", "", text)
+
+
+def _phrase_matches(pattern, text):
+    """
+    True if a normalized transcription matches one curriculum form: "a / b" accepts
+    either alternative; "... " is a slot the learner fills, so only the fixed parts
+    must appear, in order.
+    """
+    for alternative in pattern.split("/"):
+        fragments = [normalize_phrase(part) for part in alternative.split("...")]
+        if len(fragments) == 1:
+            if fragments[0] and text == fragments[0]:
+                return True
+            continue
+        pos = 0
+        for fragment in fragments:
+            found = text.find(fragment, pos)
+            if found < 0:
+                break
+            pos = found + len(fragment)
+        else:
+            return True
+    return False
+
+
+def match_lesson(transcription, romanized=None, prefer=None):
+    """
+    Index of the curriculum phrase a transcription (hangul, or the romanized
+    form) corresponds to, or None if it isn't a curriculum phrase.
+    `prefer` (usually the current lesson) is checked first.
+    """
+    hangul_text = normalize_phrase(transcription)
+    romanized_text = normalize_phrase(romanized)
+    if not hangul_text and not romanized_text:
+        return None
+
+    order = list(range(len(LESSONS)))
+    if prefer is not None and 0 <= prefer < len(LESSONS):
+        order.remove(prefer)
+        order.insert(0, prefer)
+    for index in order:
+        lesson_romanized, hangul, _ = LESSONS[index]
+        if (hangul_text and _phrase_matches(hangul, hangul_text)) or \
+                (romanized_text and _phrase_matches(lesson_romanized, romanized_text)):
+            return index
+    return None
+
+
+def weak_phrases(progress, limit=5):
+    """Phrases from a progress record whose last attempt was below PASS_SCORE, worst first."""
+    weak = [(p, s) for p, s in progress.get("phrase_stats", {}).items() if s.get("last", 0) < PASS_SCORE]
+    weak.sort(key=lambda item: item[1]["last"])
+    return weak[:limit]
+
+
+def reference_text(index: int):
+    """
+    Hangul of the lesson at `index` if it is a fixed phrase that can be compared
+    against a reference recording; None for templates ("..."), alternatives ("/")
+    or a finished curriculum.
+    """
+    lesson = get_lesson(index)
+    if lesson is None:
+        return None
+    hangul = lesson[2]
+    if "..." in hangul or "/" in hangul:
+        return None
+    return hangul
+
+
+def local_pass_analysis(index: int, score: float):
+    """
+    Analysis dict (same shape as Gemini's) for a lesson attempt the local
+    pre-scorer accepted as a clear pass: praises it and introduces the next lesson.
+    """
+    _, romanized, hangul, spanish = get_lesson(index)
+    upcoming = get_lesson(index + 1)
+    if upcoming:
+        _, next_romanized, next_hangul, next_spanish = upcoming
+        reply = (next_hangul, next_romanized, next_romanized, f"Siguiente lección: {next_spanish}")
+    else:
+        reply = ("축하해요!", "Chukahaeyo!", "Chu-ka-he-yo", "¡Felicidades! Terminaste el currículo.")
+
+    return {
+        "transcription": hangul,
+        "transcription_romanized": romanized,
+        "pronunciation_score": round(score),
+        "feedback": f"¡Muy bien! Tu \"{romanized}\" ({spanish}) suena muy parecido a la referencia. Pasemos a la siguiente.",
+        "reply_text": reply[0],
+        "reply_romanized": reply[1],
+        "reply_phonetic_es": reply[2],
+        "reply_translation": reply[3]
+    }
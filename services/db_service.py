@@ -1,29 +1,147 @@
 
 import logging
-import os
-from datetime import datetime
-from supabase import create_client, Client
+from collections import OrderedDict
+from datetime import datetime, timezone
 
-from config import SUPABASE_URL, SUPABASE_KEY
+from config import DB_BACKEND, SQLITE_PATH, HISTORY_LIMIT, PROGRESS_CACHE_SIZE
+from services.curriculum import LESSONS, PASS_SCORE, match_lesson
+from services import tracing
 
 logger = logging.getLogger(__name__)
 
+# Narrow projections: hot reads only fetch the columns they use
+CONTEXT_COLUMNS = "role, transcription, content_text, feedback_text"
+EXPORT_COLUMNS = (
+    "id, user_id, role, content_text, content_audio_path, transcription, "
+    "transcription_romanized, pronunciation_score, feedback_text, created_at"
+)
+
+# Keep the progress row compact: only the most recently practiced phrases are tracked
+MAX_TRACKED_PHRASES = 50
+
+
+def empty_progress(user_id):
+    """Default progress record for a user with no graded attempts yet."""
+    return {
+        "user_id": user_id,
+        "lesson_index": 0,
+        "phrase_stats": {},
+        "total_attempts": 0,
+        "updated_at": None
+    }
+
+
+def apply_interaction_to_progress(progress, role, analysis_data):
+    """
+    Folds one interaction into a progress record (incremental update).
+    Returns True if the record changed.
+    Only graded user turns count. Stats are keyed by the curriculum phrase the
+    attempt matches (free speech and misrecognitions aren't tracked), and a
+    score >= PASS_SCORE advances the lesson only if the attempt was the current
+    lesson's phrase, mirroring the flow rule in SYSTEM_PROMPT.
+    """
+    if role != 'user' or not analysis_data:
+        return False
+
+    try:
+        score = int(analysis_data.get('pronunciation_score') or 0)
+    except (TypeError, ValueError):
+        return False
+    if score <= 0:
+        return False
+
+    progress["total_attempts"] += 1
+    progress["updated_at"] = datetime.now(timezone.utc).isoformat()
+
+    index = match_lesson(
+        analysis_data.get('transcription'), analysis_data.get('transcription_romanized'),
+        prefer=progress["lesson_index"]
+    )
+    if index is None:
+        return True
+
+    phrase = LESSONS[index][1]
+    stats = progress["phrase_stats"]
+    entry = stats.pop(phrase, {"best": 0, "last": 0, "attempts": 0})
+    entry["best"] = max(entry["best"], score)
+    entry["last"] = score
+    entry["attempts"] += 1
+    # Re-insert so dict order is "least recently practiced first"
+    stats[phrase] = entry
+    while len(stats) > MAX_TRACKED_PHRASES:
+        stats.pop(next(iter(stats)))
+
+    if index == progress["lesson_index"] and score >= PASS_SCORE:
+        progress["lesson_index"] += 1
+    return True
+
+
+def progress_from_row(user_id, row):
+    """Normalizes a user_progress row (or None) into a progress record."""
+    progress = empty_progress(user_id)
+    if row:
+        progress.update({
+            "lesson_index": row.get("lesson_index") or 0,
+            "phrase_stats": row.get("phrase_stats") or {},
+            "total_attempts": row.get("total_attempts") or 0,
+            "updated_at": row.get("updated_at")
+        })
+    return progress
+
+
+def interaction_row(user_id, role, content_text, audio_path, analysis_data):
+    """Maps a handler interaction + Gemini analysis onto the interactions table columns."""
+    return {
+        "user_id": user_id,
+        "role": role,
+        "content_text": content_text,
+        "content_audio_path": audio_path,
+        "transcription": analysis_data.get('transcription'),
+        "transcription_romanized": analysis_data.get('transcription_romanized'),
+        "pronunciation_score": analysis_data.get('pronunciation_score'),
+        "feedback_text": analysis_data.get('feedback')
+    }
+
+
+def format_history(rows):
+    """Newest-first interaction rows -> chronological history lines for Gemini."""
+    history = []
+    for row in reversed(rows):
+        if row['role'] == 'user':
+            text_part = f"User said: {row['transcription']}"
+        else:
+            text_part = f"Tutor said: {row['content_text']}. Feedback given: {row['feedback_text']}"
+        
+        history.append(text_part)
+    return history
+
+
+def create_backend(name):
+    """Instantiates the configured storage backend (imports are lazy so SQLite works offline)."""
+    if name == "sqlite":
+        from services.sqlite_backend import SQLiteBackend
+        return SQLiteBackend(SQLITE_PATH)
+    if name == "supabase":
+        from services.supabase_backend import SupabaseBackend
+        return SupabaseBackend()
+    raise ValueError(f"Unknown DB_BACKEND '{name}' (expected 'supabase' or 'sqlite')")
+
+
 class DBService:
-    def __init__(self):
-        self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        logger.info("Connected to Supabase Cloud.")
+    """
+    Storage facade used by the handlers. Delegates raw reads/writes to a
+    pluggable backend (Supabase or local SQLite) selected by DB_BACKEND.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or create_backend(DB_BACKEND)
+        # user_id -> progress record (write-through LRU cache of the user_progress table)
+        self._progress_cache = OrderedDict()
 
     def update_user(self, user_id, username, first_name):
         """Updates user last_active or inserts new user."""
         try:
-            data = {
-                "user_id": user_id,
-                "username": username,
-                "first_name": first_name,
-                "last_active": "now()"
-            }
-            # upsert provided by Supabase client
-            self.supabase.table("users").upsert(data).execute()
+            self.backend.upsert_user(user_id, username, first_name)
         except Exception as e:
             logger.error(f"Error updating user {user_id}: {e}")
 
@@ -35,48 +153,167 @@ class DBService:
             if analysis_data is None:
                 analysis_data = {}
             
-            data = {
-                "user_id": user_id,
-                "role": role,
-                "content_text": content_text,
-                "content_audio_path": audio_path,
-                "transcription": analysis_data.get('transcription'),
-                "transcription_romanized": analysis_data.get('transcription_romanized'),
-                "pronunciation_score": analysis_data.get('pronunciation_score'),
-                "feedback_text": analysis_data.get('feedback')
-            }
-            
-            self.supabase.table("interactions").insert(data).execute()
-            logger.info(f"Saved interaction for user {user_id} ({role}) to Supabase")
+            data = interaction_row(user_id, role, content_text, audio_path, analysis_data)
+            self.backend.insert_interaction(data)
+            logger.info(f"Saved interaction for user {user_id} ({role}) to {self.backend.name}")
         except Exception as e:
             logger.error(f"Error saving interaction: {e}")
+            return
+
+        self._update_progress(user_id, role, analysis_data)
+
+    def get_progress(self, user_id):
+        """
+        Returns the materialized progress record for a user (single-row read, cached).
+        A failed read returns a default record (never cached or written back).
+        """
+        try:
+            return self._load_progress(user_id)
+        except Exception as e:
+            logger.error(f"Error retrieving progress for user {user_id}: {e}")
+            return empty_progress(user_id)
 
-    def get_context(self, user_id, limit=1000):
+    def _load_progress(self, user_id):
+        """Cached progress record; read errors propagate (and aren't cached, so the next call retries)."""
+        cached = self._cached_progress(user_id)
+        if cached is not None:
+            return cached
+        progress = progress_from_row(user_id, self.backend.fetch_progress(user_id))
+        self._cache_progress(user_id, progress)
+        return progress
+
+    def _cached_progress(self, user_id):
+        progress = self._progress_cache.get(user_id)
+        if progress is not None:
+            self._progress_cache.move_to_end(user_id)
+        return progress
+
+    def _cache_progress(self, user_id, progress):
+        """Caches a progress record, evicting the least recently used users beyond PROGRESS_CACHE_SIZE."""
+        self._progress_cache[user_id] = progress
+        self._progress_cache.move_to_end(user_id)
+        while len(self._progress_cache) > PROGRESS_CACHE_SIZE:
+            self._progress_cache.popitem(last=False)
+
+    def _update_progress(self, user_id, role, analysis_data):
+        """Incrementally updates user_progress from a freshly saved interaction."""
+        try:
+            progress = self._load_progress(user_id)
+        except Exception as e:
+            # Folding into a default record would overwrite the real row with it
+            logger.error(f"Skipping progress update for user {user_id}, read failed: {e}")
+            return
+        if not apply_interaction_to_progress(progress, role, analysis_data):
+            return
+        try:
+            self.backend.upsert_progress(progress)
+        except Exception as e:
+            logger.error(f"Error saving progress for user {user_id}: {e}")
+
+    def get_context(self, user_id, limit=HISTORY_LIMIT):
         """
         Retrieves last N messages formatted for Gemini context.
-        Limit increased to 1000 for "Titan Memory" with Gemini Flash.
+        Long-term state (lesson, weak phrases) lives in user_progress,
+        so only a short window of recent turns is needed here.
         """
         try:
-            response = self.supabase.table("interactions")\
-                .select("*")\
-                .eq("user_id", user_id)\
-                .order("created_at", desc=True)\
-                .limit(limit)\
-                .execute()
-            
-            rows = response.data
-            
-            # Reconstruct history in chronological order (oldest first)
-            history = []
-            for row in reversed(rows):
-                if row['role'] == 'user':
-                    text_part = f"User said: {row['transcription']}"
-                else:
-                    text_part = f"Tutor said: {row['content_text']}. Feedback given: {row['feedback_text']}"
-                
-                history.append(text_part)
-            
-            return history
+            rows = self.backend.fetch_recent(user_id, limit, CONTEXT_COLUMNS)
+            return format_history(rows)
+        except Exception as e:
+            logger.error(f"Error retrieving context: {e}")
+            return []
+
+    def iter_interactions(self, user_id=None, batch_size=500, columns=EXPORT_COLUMNS):
+        """
+        Streams interactions oldest-first using a keyset cursor on (created_at, id).
+        Only one batch is held in memory at a time; pass user_id=None for the whole table.
+        """
+        cursor = None
+        while True:
+            rows = self.backend.fetch_page(user_id, batch_size, cursor, columns)
+            if not rows:
+                return
+
+            yield from rows
+
+            if len(rows) < batch_size:
+                return
+            cursor = (rows[-1]["created_at"], rows[-1]["id"])
+
+    def close(self):
+        self.backend.close()
+
+    # --- Async API ---
+    # Same semantics as the sync methods above, but awaited directly by handlers
+    # on the backend's own pooled client instead of hopping through asyncio.to_thread.
+
+    @tracing.traced("db.update_user")
+    async def aupdate_user(self, user_id, username, first_name):
+        try:
+            await self.backend.aupsert_user(user_id, username, first_name)
+        except Exception as e:
+            logger.error(f"Error updating user {user_id}: {e}")
+
+    @tracing.traced("db.save_interaction")
+    async def asave_interaction(self, user_id, role, content_text=None, audio_path=None, analysis_data=None):
+        if analysis_data is None:
+            analysis_data = {}
+        try:
+            data = interaction_row(user_id, role, content_text, audio_path, analysis_data)
+            await self.backend.ainsert_interaction(data)
+            logger.info(f"Saved interaction for user {user_id} ({role}) to {self.backend.name}")
+        except Exception as e:
+            logger.error(f"Error saving interaction: {e}")
+            return
+
+        try:
+            progress = await self._aload_progress(user_id)
+        except Exception as e:
+            logger.error(f"Skipping progress update for user {user_id}, read failed: {e}")
+            return
+        if not apply_interaction_to_progress(progress, role, analysis_data):
+            return
+        try:
+            await self.backend.aupsert_progress(progress)
+        except Exception as e:
+            logger.error(f"Error saving progress for user {user_id}: {e}")
+
+    @tracing.traced("db.get_progress")
+    async def aget_progress(self, user_id):
+        try:
+            return await self._aload_progress(user_id)
+        except Exception as e:
+            logger.error(f"Error retrieving progress for user {user_id}: {e}")
+            return empty_progress(user_id)
+
+    async def _aload_progress(self, user_id):
+        cached = self._cached_progress(user_id)
+        if cached is not None:
+            return cached
+        progress = progress_from_row(user_id, await self.backend.afetch_progress(user_id))
+        self._cache_progress(user_id, progress)
+        return progress
+
+    @tracing.traced("db.get_context")
+    async def aget_context(self, user_id, limit=HISTORY_LIMIT):
+        try:
+            rows = await self.backend.afetch_recent(user_id, limit, CONTEXT_COLUMNS)
+            return format_history(rows)
         except Exception as e:
             logger.error(f"Error retrieving context: {e}")
             return []
+
+    @tracing.traced("db.fetch_inactive_users")
+    async def afetch_inactive_users(self, active_before, active_after, after_user_id=0, limit=100):
+        """
+        One keyset page (by user_id) of users whose last_active is in [active_after, active_before),
+        with their current lesson_index. Errors propagate so batch jobs can stop and resume later.
+        """
+        return await self.backend.afetch_inactive_users(active_before, active_after, after_user_id, limit)
+
+    def pool_stats(self):
+        """Backend connection/concurrency snapshot (also exported via metrics)."""
+        return self.backend.pool_stats()
+
+    async def aclose(self):
+        await self.backend.aclose()
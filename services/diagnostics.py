@@ -0,0 +1,277 @@
+"""
+Live-process diagnostics for the admin endpoints on the keep-alive server:
+sampling CPU profiler, tracemalloc snapshots/diffs, open file descriptors,
+leftover temp audio files, asyncio task stacks and live service status. Everything is stdlib so it
+works in the slim deployment image; results are also written to
+DIAGNOSTICS_DIR for download and offline analysis.
+"""
+import asyncio
+import collections
+import glob
+import io
+import linecache
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Temp files the handlers create in the working directory
+TEMP_PATTERNS = ("voice_*", "reply_*", "lesson1_*", "reference_*", "reminder_*", "response_*")
+
+
+def _stamp():
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+class SamplingProfiler:
+    """
+    Statistical CPU profiler: a daemon thread samples every thread's stack
+    each `interval` seconds via sys._current_frames() and counts collapsed
+    stacks ("a;b;c N" lines, the input format of flamegraph.pl / speedscope).
+    """
+
+    def __init__(self):
+        self._thread = None
+        self._stop = threading.Event()
+        self._counts = collections.Counter()
+        self._samples = 0
+        self._started_at = None
+        self.interval = 0.01
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=0.01):
+        if self.running:
+            raise RuntimeError("Profiler already running")
+        self.interval = interval
+        self._counts.clear()
+        self._samples = 0
+        self._stop.clear()
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="kvoice-profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._counts[";".join(reversed(stack))] += 1
+            self._samples += 1
+
+    def stop(self, out_dir):
+        """Stops sampling; writes the collapsed stacks to out_dir and returns a summary."""
+        if not self.running:
+            raise RuntimeError("Profiler is not running")
+        self._stop.set()
+        self._thread.join()
+        duration = time.monotonic() - self._started_at
+
+        path = os.path.join(out_dir, f"profile-{_stamp()}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self._counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+        # Self time: samples where a function is the innermost frame
+        leaf = collections.Counter()
+        for stack, count in self._counts.items():
+            leaf[stack.rsplit(";", 1)[-1]] += count
+        total = sum(self._counts.values()) or 1
+        return {
+            "duration_seconds": round(duration, 2),
+            "samples": self._samples,
+            "file": os.path.basename(path),
+            "top_self": [{"frame": frame, "share": round(count / total, 4)} for frame, count in leaf.most_common(25)]
+        }
+
+
+class MemoryTracker:
+    """tracemalloc wrapper: top allocation sites, diffs against a baseline, snapshot dumps."""
+
+    def __init__(self):
+        self._baseline = None
+
+    def start(self, frames=25):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._baseline = tracemalloc.take_snapshot()
+
+    def stop(self):
+        tracemalloc.stop()
+        self._baseline = None
+
+    @staticmethod
+    def _snapshot():
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running (start it first)")
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+        ))
+
+    @staticmethod
+    def _format(stat):
+        frame = stat.traceback[0]
+        return {
+            "location": f"{frame.filename}:{frame.lineno}",
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count,
+            "line": linecache.getline(frame.filename, frame.lineno).strip()
+        }
+
+    def top(self, limit=25, key_type="lineno"):
+        snapshot = self._snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "traced_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "top": [self._format(stat) for stat in snapshot.statistics(key_type)[:limit]]
+        }
+
+    def diff(self, limit=25, key_type="lineno", reset=False):
+        """Growth since the baseline (taken at start, or at the last diff with reset=True)."""
+        snapshot = self._snapshot()
+        if self._baseline is None:
+            self._baseline = snapshot
+        stats = snapshot.compare_to(self._baseline, key_type)[:limit]
+        if reset:
+            self._baseline = snapshot
+        return {
+            "diff": [
+                dict(self._format(stat), size_diff_kb=round(stat.size_diff / 1024, 1), count_diff=stat.count_diff)
+                for stat in stats
+            ]
+        }
+
+    def dump(self, out_dir):
+        """Writes a raw snapshot (load offline with tracemalloc.Snapshot.load)."""
+        path = os.path.join(out_dir, f"tracemalloc-{_stamp()}.snapshot")
+        self._snapshot().dump(path)
+        return {"file": os.path.basename(path)}
+
+
+def process_memory():
+    """Current/peak RSS in KB from /proc (Linux), falling back to getrusage."""
+    info = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS", "VmHWM")):
+                    key, value = line.split(":", 1)
+                    info[key] = int(value.split()[0])
+    except OSError:
+        import resource
+        info["VmHWM"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"rss_kb": info.get("VmRSS"), "peak_rss_kb": info.get("VmHWM")}
+
+
+def open_fds():
+    """Open file descriptors and their targets (files, sockets, pipes)."""
+    fd_dir = "/proc/self/fd" if os.path.isdir("/proc/self/fd") else "/dev/fd"
+    fds = []
+    for name in sorted(os.listdir(fd_dir), key=int):
+        try:
+            target = os.readlink(os.path.join(fd_dir, name))
+        except OSError:
+            target = "?"
+        fds.append({"fd": int(name), "target": target})
+    kinds = collections.Counter(
+        "socket" if fd["target"].startswith("socket:") else "pipe" if fd["target"].startswith("pipe:")
+        else "file" for fd in fds
+    )
+    return {"count": len(fds), "by_kind": dict(kinds), "fds": fds}
+
+
+def temp_files(directory="."):
+    """Leftover handler temp files (audio that cleanup_files should have removed), oldest first."""
+    now = time.time()
+    files = []
+    for pattern in TEMP_PATTERNS:
+        for path in glob.glob(os.path.join(directory, pattern)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append({"path": path, "size_kb": round(stat.st_size / 1024, 1), "age_seconds": round(now - stat.st_mtime)})
+    files.sort(key=lambda f: -f["age_seconds"])
+    return {"count": len(files), "total_kb": round(sum(f["size_kb"] for f in files), 1), "files": files}
+
+
+_loop = None
+
+
+def register_loop(loop):
+    """Called from the bot's event loop at startup so other threads can inspect its tasks."""
+    global _loop
+    _loop = loop
+
+
+async def _collect_tasks():
+    tasks = []
+    for task in asyncio.all_tasks():
+        buffer = io.StringIO()
+        task.print_stack(file=buffer)
+        tasks.append({
+            "name": task.get_name(),
+            "coro": getattr(task.get_coro(), "__qualname__", repr(task.get_coro())),
+            "done": task.done(),
+            "stack": buffer.getvalue()
+        })
+    tasks.sort(key=lambda t: t["coro"])
+    return tasks
+
+
+def asyncio_tasks(timeout=5):
+    """Snapshot of every task on the bot loop, collected inside the loop (thread-safe)."""
+    if _loop is None or _loop.is_closed():
+        raise RuntimeError("Bot event loop is not running")
+    tasks = asyncio.run_coroutine_threadsafe(_collect_tasks(), _loop).result(timeout)
+    by_coro = collections.Counter(t["coro"] for t in tasks)
+    return {"count": len(tasks), "by_coro": dict(by_coro.most_common()), "tasks": tasks}
+
+
+# name -> zero-argument callable returning a JSON-serializable snapshot (registered by bot.py)
+_status_providers = {}
+
+
+def register_status(name, provider):
+    _status_providers[name] = provider
+
+
+async def _collect_status(names):
+    status = {}
+    for name in names:
+        try:
+            status[name] = _status_providers[name]()
+        except Exception as e:
+            status[name] = {"error": str(e)}
+    return status
+
+
+def service_status(names=None, timeout=5):
+    """Snapshots of the registered services, taken inside the bot loop so they are consistent."""
+    names = [name for name in (names or _status_providers) if name in _status_providers]
+    if _loop is None or _loop.is_closed():
+        raise RuntimeError("Bot event loop is not running")
+    return asyncio.run_coroutine_threadsafe(_collect_status(names), _loop).result(timeout)
+
+
+profiler = SamplingProfiler()
+memory = MemoryTracker()
@@ -6,7 +6,12 @@ import json
 import logging
 import functools
 import google.generativeai as genai
-from config import GEMINI_API_KEY
+from config import (
+    GEMINI_API_KEY, PROMPT_CACHE_ENABLED, PROMPT_CACHE_TTL, PROMPT_CACHE_REFRESH_MARGIN, SEGMENT_CONCURRENCY
+)
+from services.curriculum import get_lesson, weak_phrases
+from services import tracing, metrics
+from services.prompt_cache import PromptCache, is_cache_error
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +19,12 @@ logger = logging.getLogger(__name__)
 genai.configure(api_key=GEMINI_API_KEY)
 
 MODEL_NAME = "gemini-2.5-flash-lite"  # User requested model
+GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+GENERATE_LATENCY = metrics.histogram(
+    "kvoice_gemini_generate_seconds",
+    "generate_content latency by call type and prompt path (cached/uncached system prompt)"
+)
 
 # System Prompt mandated by SENSEI LOGIC (Beginner Pivot)
 SYSTEM_PROMPT = """
@@ -120,14 +131,110 @@ def retry_on_error(max_retries=3, delay=1):
         return wrapper
     return decorator
 
+def format_progress(progress=None):
+    """Prompt block with the materialized user_progress record."""
+    block = ""
+    if progress:
+        lesson = get_lesson(progress.get("lesson_index", 0))
+        block += "\n\n**LEARNER PROGRESS (authoritative, use it instead of guessing from history):**\n"
+        if lesson:
+            number, romanized, hangul, spanish = lesson
+            block += f"- Current lesson: {number}. {romanized} ({hangul}) - {spanish}\n"
+        else:
+            block += "- Curriculum completed: Free Conversation\n"
+        block += f"- Graded attempts so far: {progress.get('total_attempts', 0)}\n"
+        weak = weak_phrases(progress)
+        if weak:
+            block += "- Weak phrases (last score): " + ", ".join(f"{p} ({s['last']})" for p, s in weak) + "\n"
+    return block
+
+def format_history(history=None):
+    """Prompt block with the recent conversation turns."""
+    block = ""
+    if history and len(history) > 0:
+        block += "\n\n**CONVERSATION HISTORY (Most recent last):**\n"
+        for item in history:
+            block += f"- {item}\n"
+        block += "\n**END OF HISTORY**\n"
+    return block
+
+def format_context(history=None, progress=None):
+    """Builds the dynamic prompt block: materialized progress + recent history."""
+    return format_progress(progress) + format_history(history)
+
+def prompt_sections(instruction, history=None, progress=None):
+    """Character size of each text section of a request (for token attribution)."""
+    return {
+        "system": len(SYSTEM_PROMPT),
+        "instruction": len(instruction),
+        "progress": len(format_progress(progress)),
+        "history": len(format_history(history))
+    }
+
+def merge_segment_analyses(analyses, durations_ms):
+    """
+    Combines per-segment analyses into one feedback card:
+    transcriptions are concatenated, the score is the duration-weighted mean of
+    the scored parts, feedback is listed per part, and the conversational reply
+    comes from the last part (the most recent thing the learner said).
+    """
+    scored = [(int(a.get("pronunciation_score") or 0), d) for a, d in zip(analyses, durations_ms)]
+    scored = [(score, d) for score, d in scored if score > 0]
+    weight = sum(d for _, d in scored)
+    score = round(sum(score * d for score, d in scored) / weight) if weight else 0
+
+    merged = dict(analyses[-1])
+    merged.update({
+        "transcription": " ".join(a.get("transcription") or "" for a in analyses).strip(),
+        "transcription_romanized": " ".join(a.get("transcription_romanized") or "" for a in analyses).strip(),
+        "pronunciation_score": score,
+        "feedback": "\n".join(f"({i}) {a.get('feedback')}" for i, a in enumerate(analyses, 1) if a.get("feedback"))
+    })
+    return merged
+
 class GeminiService:
-    def __init__(self):
+    def __init__(self, usage_tracker=None, prompt_cache=None):
+        # Optional UsageTracker: records usage_metadata of every generate_content call
+        self.usage = usage_tracker
         self.model = genai.GenerativeModel(
             model_name=MODEL_NAME,
             system_instruction=SYSTEM_PROMPT,
-            generation_config={"response_mime_type": "application/json"}
+            generation_config=GENERATION_CONFIG
         )
+        # Explicit context cache for the static SYSTEM_PROMPT; self.model is the fallback
+        if prompt_cache is None and PROMPT_CACHE_ENABLED:
+            prompt_cache = PromptCache(
+                MODEL_NAME, SYSTEM_PROMPT, self.model, GENERATION_CONFIG,
+                ttl_seconds=PROMPT_CACHE_TTL,
+                refresh_margin=PROMPT_CACHE_REFRESH_MARGIN
+            )
+        self.prompt_cache = prompt_cache
+        # user_id -> [Semaphore bounding concurrent segment analyses, long notes using it];
+        # dropped once the user's last long note finishes, so it only holds active users
+        self._user_slots = {}
+
+    async def _generate(self, prompt_parts, call_type):
+        """generate_content on the cached-prompt model when available, else the plain model."""
+        model, path = await self.prompt_cache.model() if self.prompt_cache else (self.model, "uncached")
+        start = time.perf_counter()
+        try:
+            # Run blocking generation in a separate thread
+            response = await asyncio.to_thread(model.generate_content, prompt_parts)
+        except Exception as e:
+            if path != "cached" or not is_cache_error(e):
+                raise
+            # Cache vanished server-side: drop it and retry once with the full system_instruction
+            self.prompt_cache.invalidate(str(e))
+            path = "uncached"
+            start = time.perf_counter()
+            response = await asyncio.to_thread(self.model.generate_content, prompt_parts)
+        GENERATE_LATENCY.observe(time.perf_counter() - start, call=call_type, path=path)
+        span = tracing.current_span()
+        if span:
+            span.set(prompt_path=path)
+        return response
 
+    @tracing.traced("gemini.upload_audio")
     async def upload_audio(self, mp3_path: str):
         """Uploads file to Gemini File API (Non-blocking)."""
         logger.info(f"Uploading {mp3_path} to Gemini...")
@@ -136,20 +243,25 @@ class GeminiService:
         logger.info(f"File uploaded: {file_ref.name}")
         return file_ref
 
+    @tracing.traced("gemini.analyze_audio")
     @retry_on_error()
-    async def analyze_audio(self, audio_file_ref, history=None):
+    async def analyze_audio(self, audio_file_ref, history=None, progress=None, user_id=None, audio_seconds=None,
+                            segment=None):
         """
         Sends audio to Gemini and gets JSON response.
         history: List of strings/messages from previous turns.
+        progress: Materialized user_progress record (see DBService.get_progress).
+        user_id/audio_seconds: used for token accounting only.
+        segment: (index, total) when the clip is one part of a longer voice note.
         """
-        # 1. Construct the rich prompt with history
-        prompt_content = "Analyze this audio clip based on the system instructions.\n"
-        
-        if history and len(history) > 0:
-            prompt_content += "\n\n**CONVERSATION HISTORY (Most recent last):**\n"
-            for item in history:
-                prompt_content += f"- {item}\n"
-            prompt_content += "\n**END OF HISTORY**\n"
+        # 1. Construct the rich prompt with progress + history
+        instruction = "Analyze this audio clip based on the system instructions.\n"
+        if segment:
+            instruction += (
+                f"This clip is part {segment[0]} of {segment[1]} of one longer voice note. "
+                "Transcribe and score only this part.\n"
+            )
+        prompt_content = instruction + format_context(history, progress)
             
         prompt_parts = [
             prompt_content,
@@ -160,8 +272,9 @@ class GeminiService:
         # For this statless MVP audio-analysis, we just send the file + prompt.
         
         logger.info("Sending request to Gemini...")
-        # Run blocking generation in a separate thread
-        response = await asyncio.to_thread(self.model.generate_content, prompt_parts)
+        response = await self._generate(prompt_parts, "audio")
+        if self.usage:
+            self.usage.record(user_id, "audio", response, prompt_sections(instruction, history, progress), audio_seconds)
         
         try:
             # Check for valid text part or safety rejection
@@ -197,25 +310,22 @@ class GeminiService:
                 "reply_romanized": "Joesonghamnida. Dasi malsseumhae juseyo."
             }
 
+    @tracing.traced("gemini.analyze_text")
     @retry_on_error()
-    async def analyze_text(self, user_text, history=None):
+    async def analyze_text(self, user_text, history=None, progress=None, user_id=None):
         """
         Analyzes TEXT input (for typed messages or 'Necesito decir' commands).
         """
-        # 1. Construct the rich prompt with history
-        prompt_content = f"Analyze this user TEXT input: '{user_text}'\nBased on system instructions."
-        
-        if history and len(history) > 0:
-            prompt_content += "\n\n**CONVERSATION HISTORY (Most recent last):**\n"
-            for item in history:
-                prompt_content += f"- {item}\n"
-            prompt_content += "\n**END OF HISTORY**\n"
+        # 1. Construct the rich prompt with progress + history
+        instruction = f"Analyze this user TEXT input: '{user_text}'\nBased on system instructions."
+        prompt_content = instruction + format_context(history, progress)
             
         prompt_parts = [prompt_content]
         
         logger.info("Sending TEXT request to Gemini...")
-        # Run blocking generation in a separate thread
-        response = await asyncio.to_thread(self.model.generate_content, prompt_parts)
+        response = await self._generate(prompt_parts, "text")
+        if self.usage:
+            self.usage.record(user_id, "text", response, prompt_sections(instruction, history, progress))
         
         try:
             text_response = response.text
@@ -236,11 +346,67 @@ class GeminiService:
                 "reply_phonetic_es": "Chue-song-jam-ni-da"
             }
 
+    async def analyze_long_audio(self, segments, history=None, progress=None, user_id=None, on_segment=None):
+        """
+        Analyzes the segments of a long voice note concurrently and merges the results.
+        segments: [(mp3_path, duration_ms), ...] from AudioService.split_on_silence.
+        on_segment: optional async callback(index, total, analysis) fired as each part finishes.
+        At most SEGMENT_CONCURRENCY parts per user are uploaded/analyzed at once.
+        """
+        entry = self._user_slots.setdefault(user_id, [asyncio.Semaphore(SEGMENT_CONCURRENCY), 0])
+        entry[1] += 1
+        try:
+            return await self._analyze_segments(entry[0], segments, history, progress, user_id, on_segment)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._user_slots[user_id]
+
+    async def _analyze_segments(self, slots, segments, history, progress, user_id, on_segment):
+        total = len(segments)
+
+        async def run(index, path, duration_ms):
+            async with slots:
+                file_ref = None
+                try:
+                    with tracing.span("gemini.analyze_segment", index=index, total=total):
+                        file_ref = await self.upload_audio(path)
+                        analysis = await self.analyze_audio(
+                            file_ref,
+                            history=history,
+                            progress=progress,
+                            user_id=user_id,
+                            audio_seconds=duration_ms / 1000,
+                            segment=(index, total)
+                        )
+                finally:
+                    if file_ref:
+                        await asyncio.to_thread(self.cleanup_gemini_file, file_ref)
+            if on_segment:
+                try:
+                    await on_segment(index, total, analysis)
+                except Exception as e:
+                    logger.warning(f"Partial feedback for segment {index} failed: {e}")
+            return analysis
+
+        results = await asyncio.gather(*(
+            run(i + 1, path, duration_ms) for i, (path, duration_ms) in enumerate(segments)
+        ), return_exceptions=True)
+
+        # A failed part shouldn't sink the whole note; only fail if nothing could be analyzed
+        ok = [(r, d) for r, (_, d) in zip(results, segments) if not isinstance(r, BaseException)]
+        if not ok:
+            raise results[0]
+        if len(ok) < total:
+            logger.warning(f"{total - len(ok)} of {total} segments failed for user {user_id}")
+        return merge_segment_analyses([r for r, _ in ok], [d for _, d in ok])
+
     @staticmethod
     def cleanup_gemini_file(file_ref):
         """Deletes the file from Gemini cloud storage to avoid clutter."""
         try:
-            genai.delete_file(file_ref.name)
+            with tracing.span("gemini.delete_file"):
+                genai.delete_file(file_ref.name)
             logger.debug(f"Deleted Gemini file: {file_ref.name}")
         except Exception as e:
             logger.warning(f"Failed to delete Gemini file: {e}")
@@ -0,0 +1,121 @@
+import logging
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+MODE_GAUGE = metrics.gauge("kvoice_load_mode", "Current degradation level (0=normal .. 3=shed)")
+MODE_TRANSITIONS = metrics.counter("kvoice_load_mode_transitions_total", "Load mode changes (labels from/to)")
+DEPTH_GAUGE = metrics.gauge("kvoice_load_depth", "Requests in flight plus updates queued")
+LATENCY_GAUGE = metrics.gauge("kvoice_load_latency_ewma_seconds", "Decayed EWMA of Gemini call latency")
+SHED_TOTAL = metrics.counter("kvoice_load_shed_total", "Requests answered with the busy message")
+
+
+class LoadMode(IntEnum):
+    NORMAL = 0
+    REDUCED_HISTORY = 1  # fewer history rows in the prompt
+    TEXT_ONLY = 2        # skip TTS, single text reply
+    SHED = 3             # "busy, retry shortly"
+
+
+class LoadGovernor:
+    """
+    Picks a degradation level from queue depth and observed Gemini latency.
+    Each signal has one threshold per level (REDUCED_HISTORY, TEXT_ONLY, SHED).
+    Escalation is immediate; de-escalation waits until both signals fall below
+    `recovery_ratio` of the current level's thresholds (hysteresis).
+    The latency EWMA decays while idle so shedding always recovers.
+    """
+
+    def __init__(self, depth_thresholds, latency_thresholds, recovery_ratio=0.7,
+                 alpha=0.3, half_life=30.0, queue_probe=None):
+        self.depth_thresholds = depth_thresholds
+        self.latency_thresholds = latency_thresholds
+        self.recovery_ratio = recovery_ratio
+        self.alpha = alpha
+        self.half_life = half_life
+        self.queue_probe = queue_probe
+        self.in_flight = 0
+        self._latency = 0.0
+        self._latency_at = time.monotonic()
+        self._mode = LoadMode.NORMAL
+
+    # --- Signals ---
+
+    def depth(self):
+        queued = 0
+        if self.queue_probe:
+            try:
+                queued = self.queue_probe()
+            except Exception:
+                queued = 0
+        return self.in_flight + queued
+
+    def latency(self):
+        idle = time.monotonic() - self._latency_at
+        return self._latency * 0.5 ** (idle / self.half_life)
+
+    def record_latency(self, seconds):
+        self._latency = self.alpha * seconds + (1 - self.alpha) * self.latency()
+        self._latency_at = time.monotonic()
+        LATENCY_GAUGE.set(round(self._latency, 3))
+
+    @contextmanager
+    def timed(self):
+        """Records the block's duration (even on failure) as a latency sample."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record_latency(time.monotonic() - start)
+
+    @contextmanager
+    def track(self):
+        """Counts a request as in flight for the duration of the block."""
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    # --- Mode selection ---
+
+    @staticmethod
+    def _level(value, thresholds, scale=1.0):
+        level = LoadMode.NORMAL
+        for i, threshold in enumerate(thresholds):
+            if value >= threshold * scale:
+                level = LoadMode(i + 1)
+        return level
+
+    @property
+    def mode(self):
+        depth, latency = self.depth(), self.latency()
+        DEPTH_GAUGE.set(depth)
+
+        target = max(self._level(depth, self.depth_thresholds), self._level(latency, self.latency_thresholds))
+        if target < self._mode:
+            # Only step down while both signals are clearly below the current level
+            held = max(
+                self._level(depth, self.depth_thresholds, self.recovery_ratio),
+                self._level(latency, self.latency_thresholds, self.recovery_ratio)
+            )
+            target = max(target, min(held, self._mode))
+
+        if target != self._mode:
+            logger.warning(
+                f"Load mode {self._mode.name} -> {target.name} (depth={depth}, latency={latency:.1f}s)"
+            )
+            MODE_TRANSITIONS.inc(**{"from": self._mode.name, "to": target.name})
+            self._mode = target
+            MODE_GAUGE.set(int(target))
+        return self._mode
+
+    def history_limit(self, mode, base_limit, reduced_limit):
+        return base_limit if mode < LoadMode.REDUCED_HISTORY else min(base_limit, reduced_limit)
+
+    def record_shed(self):
+        SHED_TOTAL.inc()
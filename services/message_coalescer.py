@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+MESSAGES_IN = metrics.counter("kvoice_coalescer_messages_total", "Messages received by the debounce coalescer")
+BATCHES_OUT = metrics.counter("kvoice_coalescer_batches_total", "Merged batches flushed to the pipeline")
+CALLS_SAVED = metrics.counter("kvoice_coalescer_calls_saved_total", "Pipeline runs avoided by merging bursts")
+ADDED_DELAY = metrics.histogram(
+    "kvoice_coalescer_added_delay_seconds",
+    "Delay between the first message of a batch and its flush (label batch=single|multi)"
+)
+
+
+class MessageCoalescer:
+    """
+    Per-key debounce: messages arriving within `window` seconds of each other
+    are merged and handed to `flush_callback(key, items)` once.
+    The window restarts on every message but never delays a batch more than
+    `max_wait` seconds after its first message, nor beyond `max_items` messages.
+    """
+
+    def __init__(self, flush_callback, window=1.5, max_wait=5.0, max_items=10):
+        self.flush_callback = flush_callback
+        self.window = window
+        self.max_wait = max_wait
+        self.max_items = max_items
+        # key -> {"items": [...], "first_at": float, "timer": Task}
+        self._pending = {}
+        # Flushes already detached from _pending and currently running
+        self._running = set()
+
+    async def add(self, key, item):
+        MESSAGES_IN.inc()
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = {"items": [], "first_at": time.monotonic(), "timer": None}
+        else:
+            pending["timer"].cancel()
+
+        pending["items"].append(item)
+
+        elapsed = time.monotonic() - pending["first_at"]
+        if len(pending["items"]) >= self.max_items or elapsed >= self.max_wait:
+            delay = 0
+        else:
+            delay = min(self.window, self.max_wait - elapsed)
+        pending["timer"] = asyncio.create_task(self._flush_after(key, delay))
+
+    async def _flush_after(self, key, delay):
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        # Detach the batch before awaiting so a new message starts a fresh one
+        # and can no longer cancel this flush.
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+
+        items = pending["items"]
+        BATCHES_OUT.inc()
+        CALLS_SAVED.inc(len(items) - 1)
+        ADDED_DELAY.observe(time.monotonic() - pending["first_at"], batch="single" if len(items) == 1 else "multi")
+        if len(items) > 1:
+            logger.info(f"Coalesced {len(items)} messages for {key} into one request")
+
+        task = asyncio.current_task()
+        self._running.add(task)
+        try:
+            await self.flush_callback(key, items)
+        except Exception as e:
+            logger.error(f"Error flushing coalesced batch for {key}: {e}", exc_info=True)
+        finally:
+            self._running.discard(task)
+
+    async def flush_all(self):
+        """Flushes every pending batch immediately and waits for running flushes (used on shutdown)."""
+        for key in list(self._pending):
+            pending = self._pending.get(key)
+            if pending:
+                pending["timer"].cancel()
+                await self._flush_after(key, 0)
+        if self._running:
+            await asyncio.wait(set(self._running))
@@ -0,0 +1,254 @@
+import asyncio
+import contextvars
+import itertools
+import logging
+import time
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = metrics.gauge("kvoice_outbox_queue_depth", "Outgoing Bot API calls waiting for a rate-limit token")
+QUEUE_WAIT = metrics.histogram("kvoice_outbox_wait_seconds", "Time from enqueue to dispatch by priority")
+SENT = metrics.counter("kvoice_outbox_sent_total", "Bot API calls made by the outbox by method and outcome")
+RETRY_AFTER = metrics.counter("kvoice_outbox_retry_after_total", "429 RetryAfter responses from Telegram")
+DROPPED = metrics.counter("kvoice_outbox_dropped_total", "Stale or superseded chat actions that were never sent")
+
+# Lower value = sent first
+REPLY = 0
+ACTION = 1
+BULK = 2
+
+PRIORITY_NAMES = {REPLY: "reply", ACTION: "action", BULK: "bulk"}
+
+# Telegram shows a chat action for ~5 s; refresh a bit earlier
+CHAT_ACTION_INTERVAL = 4.5
+# A chat action still queued after this long is pointless
+CHAT_ACTION_TTL = 4.0
+
+
+class TokenBucket:
+    """`rate` tokens per second, up to `capacity`. block() pauses it (e.g. after a 429)."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now=None, tokens=1):
+        now = now or time.monotonic()
+        self._refill(now)
+        blocked = max(0.0, self.blocked_until - now)
+        missing = max(0.0, tokens - self.tokens) / self.rate
+        return max(blocked, missing)
+
+    def consume(self):
+        self.tokens -= 1
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    @property
+    def idle(self):
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity and time.monotonic() >= self.blocked_until
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "chat_id", "method", "kwargs", "future", "created", "attempts", "ctx")
+
+    def __init__(self, priority, seq, chat_id, method, kwargs, future):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.method = method
+        self.kwargs = kwargs
+        self.future = future
+        self.created = time.monotonic()
+        self.attempts = 0
+        # Caller's context (current trace span), so the API call's span joins the update's trace
+        self.ctx = contextvars.copy_context()
+
+
+class Outbox:
+    """
+    Single exit for Bot API sends. Calls are queued by priority (replies before
+    chat actions before bulk), released through a global and a per-chat token
+    bucket, and retried after Telegram's RetryAfter instead of failing the turn.
+    Bulk sends only take a global token while `bulk_reserve` of the capacity
+    stays free, so fan-outs can never starve interactive replies.
+    send() resolves with the Bot API result once the call was actually made,
+    so sequential sends from one handler keep their order.
+    """
+
+    def __init__(self, global_rate=25.0, chat_rate=1.0, chat_burst=3, max_attempts=3, bulk_reserve=0.3):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.bulk_tokens = 1 + bulk_reserve * global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self._chat_buckets = {}
+        self._queue = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._inflight = set()
+        self._bot = None
+        self._dispatcher = None
+
+    def start(self, bot):
+        self._bot = bot
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def close(self, timeout=30):
+        """Sends whatever is still queued (up to `timeout` seconds), then stops."""
+        deadline = time.monotonic() + timeout
+        while (self._queue or self._inflight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._dispatcher:
+            self._dispatcher.cancel()
+        for job in self._queue:
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("Outbox closed"))
+        self._queue.clear()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 1000:
+                # Full buckets carry no state worth keeping
+                for key in [k for k, b in self._chat_buckets.items() if b.idle]:
+                    del self._chat_buckets[key]
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _enqueue(self, job):
+        self._queue.append(job)
+        QUEUE_DEPTH.set(len(self._queue))
+        self._wakeup.set()
+
+    def send(self, chat_id, method, priority=REPLY, **kwargs):
+        """Queues bot.<method>(chat_id=chat_id, **kwargs); returns an awaitable with its result."""
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(_Job(priority, next(self._seq), chat_id, method, kwargs, future))
+        return future
+
+    def send_chat_action(self, chat_id, action):
+        """Fire-and-forget chat action; replaces one still queued for the same chat."""
+        for job in self._queue:
+            if job.chat_id == chat_id and job.method == "send_chat_action":
+                job.kwargs["action"] = action
+                return
+        future = self.send(chat_id, "send_chat_action", priority=ACTION, action=action)
+        # Nobody awaits chat actions; don't warn about unretrieved exceptions
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def cancel_chat_action(self, chat_id):
+        for job in [j for j in self._queue if j.chat_id == chat_id and j.method == "send_chat_action"]:
+            self._queue.remove(job)
+            job.future.cancel()
+        QUEUE_DEPTH.set(len(self._queue))
+
+    def keep_chat_action(self, chat_id, action):
+        """Shows `action` (typing, record_voice...) until the returned timer is stopped."""
+        return ChatActionTimer(self, chat_id, action)
+
+    def _next_ready(self):
+        """Highest-priority job whose chat (and the global bucket) has a token, else the shortest wait."""
+        now = time.monotonic()
+        global_wait = self.global_bucket.wait_time(now)
+        bulk_wait = self.global_bucket.wait_time(now, tokens=self.bulk_tokens)
+        shortest = None
+        for job in sorted(self._queue, key=lambda j: (j.priority, j.seq)):
+            if job.method == "send_chat_action" and now - job.created > CHAT_ACTION_TTL:
+                self._queue.remove(job)
+                DROPPED.inc()
+                job.future.cancel()
+                continue
+            wait = max(bulk_wait if job.priority >= BULK else global_wait, self._chat_bucket(job.chat_id).wait_time(now))
+            if wait <= 0:
+                return job, 0
+            shortest = wait if shortest is None else min(shortest, wait)
+        return None, shortest
+
+    async def _dispatch(self):
+        while True:
+            job, wait = self._next_ready()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._queue.remove(job)
+            QUEUE_DEPTH.set(len(self._queue))
+            self.global_bucket.consume()
+            self._chat_bucket(job.chat_id).consume()
+            QUEUE_WAIT.observe(time.monotonic() - job.created, priority=PRIORITY_NAMES.get(job.priority, "other"))
+
+            # Uploads can take seconds; don't hold up other chats meanwhile.
+            # Created inside the job's context: the task would otherwise inherit the dispatcher's
+            # (no trace) and every telegram.* span would start a trace of its own.
+            task = job.ctx.run(asyncio.create_task, self._execute(job))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _execute(self, job):
+        job.attempts += 1
+        try:
+            result = await getattr(self._bot, job.method)(chat_id=job.chat_id, **job.kwargs)
+        except RetryAfter as e:
+            RETRY_AFTER.inc(method=job.method)
+            delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else float(e.retry_after)
+            self._chat_bucket(job.chat_id).block(delay)
+            if job.attempts < self.max_attempts and job.method != "send_chat_action":
+                logger.warning(f"Flood limit on chat {job.chat_id}, retrying {job.method} in {delay}s")
+                self._enqueue(job)
+                return
+            SENT.inc(method=job.method, outcome="error")
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+        except Exception as e:
+            SENT.inc(method=job.method, outcome="error")
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+        SENT.inc(method=job.method, outcome="ok")
+        if not job.future.done():
+            job.future.set_result(result)
+
+
+class ChatActionTimer:
+    """Re-sends a chat action every CHAT_ACTION_INTERVAL seconds until stop()."""
+
+    def __init__(self, outbox, chat_id, action):
+        self.outbox = outbox
+        self.chat_id = chat_id
+        self.action = action
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            self.outbox.send_chat_action(self.chat_id, self.action)
+            await asyncio.sleep(CHAT_ACTION_INTERVAL)
+
+    def switch(self, action):
+        if action != self.action:
+            self.action = action
+            self.outbox.send_chat_action(self.chat_id, action)
+
+    def stop(self):
+        """Call before sending the reply so no stale action shows up after it."""
+        self._task.cancel()
+        self.outbox.cancel_chat_action(self.chat_id)
@@ -0,0 +1,162 @@
+import asyncio
+import datetime
+import logging
+import time
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_STATE = metrics.gauge("kvoice_prompt_cache_active", "1 while a cached-content handle for SYSTEM_PROMPT is live")
+CACHE_REFRESHES = metrics.counter("kvoice_prompt_cache_refreshes_total", "Cache create/extend attempts by action and outcome")
+CACHE_REQUESTS = metrics.counter("kvoice_prompt_cache_requests_total", "Model lookups by path (cached/uncached)")
+
+
+def genai_create_cache(model_name, system_instruction, ttl_seconds):
+    """Default factory: creates a Gemini CachedContent holding the static system prompt."""
+    from google.generativeai import caching
+    return caching.CachedContent.create(
+        model=f"models/{model_name}",
+        display_name="kvoice-system-prompt",
+        system_instruction=system_instruction,
+        ttl=datetime.timedelta(seconds=ttl_seconds)
+    )
+
+
+def genai_extend_cache(cache, ttl_seconds):
+    cache.update(ttl=datetime.timedelta(seconds=ttl_seconds))
+    return cache
+
+
+def genai_build_model(cache, generation_config):
+    import google.generativeai as genai
+    return genai.GenerativeModel.from_cached_content(cached_content=cache, generation_config=generation_config)
+
+
+def is_cache_error(error):
+    """Errors that mean the cached content is gone or unusable (expired, deleted, not found)."""
+    text = str(error).lower()
+    return "cachedcontent" in text or "cached content" in text or ("not found" in text and "cache" in text)
+
+
+def is_permanent_cache_error(error):
+    """
+    Create errors that retrying won't fix: an SDK without explicit caching
+    (google-generativeai < 0.7) or a prompt below the model's minimum cacheable size.
+    """
+    if isinstance(error, (ImportError, AttributeError)):
+        return True
+    text = str(error).lower()
+    return any(marker in text for marker in (
+        "too few tokens", "too small", "min_total_token_count", "minimum", "invalid argument", "invalid_argument"
+    ))
+
+
+class PromptCache:
+    """
+    Keeps a cached-content handle for the static SYSTEM_PROMPT alive.
+    - model() returns (model, "cached") while the handle is valid, refreshing it
+      `refresh_margin` seconds before the TTL runs out (extend first, recreate on failure).
+    - Any failure falls back to (fallback_model, "uncached") and retries after `retry_after`,
+      except permanent ones (see is_permanent_cache_error), which disable the cache for good.
+    Factories are injectable so tests can run against a local stand-in.
+    """
+
+    def __init__(self, model_name, system_instruction, fallback_model, generation_config,
+                 ttl_seconds=3600, refresh_margin=300, retry_after=600,
+                 create_cache=genai_create_cache, extend_cache=genai_extend_cache, build_model=genai_build_model):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.fallback_model = fallback_model
+        self.generation_config = generation_config
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.retry_after = retry_after
+        self._create_cache = create_cache
+        self._extend_cache = extend_cache
+        self._build_model = build_model
+
+        self._cache = None
+        self._cached_model = None
+        self._expires_at = 0.0
+        self._retry_at = 0.0
+        self.disabled = False
+        self._lock = asyncio.Lock()
+
+    def _valid(self):
+        return self._cached_model is not None and time.monotonic() < self._expires_at - self.refresh_margin
+
+    async def model(self):
+        """Returns (model, path) where path is "cached" or "uncached"."""
+        if not self.disabled and not self._valid() and time.monotonic() >= self._retry_at:
+            async with self._lock:
+                if not self.disabled and not self._valid() and time.monotonic() >= self._retry_at:
+                    await self._refresh()
+
+        if self._valid():
+            CACHE_REQUESTS.inc(path="cached")
+            return self._cached_model, "cached"
+        CACHE_REQUESTS.inc(path="uncached")
+        return self.fallback_model, "uncached"
+
+    async def _refresh(self):
+        # Extend the live handle if we still have one, otherwise create a new one
+        if self._cache is not None:
+            try:
+                await asyncio.to_thread(self._extend_cache, self._cache, self.ttl_seconds)
+                self._expires_at = time.monotonic() + self.ttl_seconds
+                CACHE_REFRESHES.inc(action="extend", outcome="ok")
+                logger.info(f"Extended system prompt cache by {self.ttl_seconds}s")
+                return
+            except Exception as e:
+                CACHE_REFRESHES.inc(action="extend", outcome="error")
+                logger.warning(f"Could not extend prompt cache, recreating: {e}")
+                self._drop()
+
+        try:
+            cache = await asyncio.to_thread(self._create_cache, self.model_name, self.system_instruction, self.ttl_seconds)
+            self._cached_model = self._build_model(cache, self.generation_config)
+            self._cache = cache
+            self._expires_at = time.monotonic() + self.ttl_seconds
+            CACHE_STATE.set(1)
+            CACHE_REFRESHES.inc(action="create", outcome="ok")
+            logger.info(f"Created system prompt cache {getattr(cache, 'name', '')} (ttl {self.ttl_seconds}s)")
+        except Exception as e:
+            self._drop()
+            CACHE_REFRESHES.inc(action="create", outcome="error")
+            if is_permanent_cache_error(e):
+                self.disabled = True
+                logger.error(f"Prompt cache disabled, using uncached system_instruction from now on: {e}")
+                return
+            self._retry_at = time.monotonic() + self.retry_after
+            logger.warning(f"Prompt cache unavailable, using uncached system_instruction for {self.retry_after}s: {e}")
+
+    def _drop(self):
+        self._cache = None
+        self._cached_model = None
+        self._expires_at = 0.0
+        CACHE_STATE.set(0)
+
+    def invalidate(self, reason=""):
+        """Called when a request using the cache failed with a cache error."""
+        logger.warning(f"Invalidating prompt cache: {reason}")
+        self._drop()
+
+    async def keep_warm(self):
+        """Background loop: refreshes the handle ahead of expiry so requests never pay for it."""
+        while not self.disabled:
+            await self.model()
+            if self._valid():
+                delay = self._expires_at - self.refresh_margin - time.monotonic()
+            else:
+                delay = self._retry_at - time.monotonic()
+            await asyncio.sleep(max(1.0, delay))
+
+    def close(self):
+        cache, self._cache = self._cache, None
+        self._drop()
+        if cache is not None:
+            try:
+                cache.delete()
+            except Exception as e:
+                logger.warning(f"Failed to delete prompt cache: {e}")
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+from telegram.error import BadRequest, Forbidden
+
+from services import metrics, tracing
+from services.curriculum import LESSONS, get_lesson, reference_text
+from services.outbox import BULK
+
+logger = logging.getLogger(__name__)
+
+REMINDERS = metrics.counter("kvoice_reminders_total", "Practice reminders by outcome (sent/blocked/failed)")
+REMINDER_PROGRESS = metrics.gauge("kvoice_reminders_processed", "Users processed by today's reminder run")
+REMINDER_RUNNING = metrics.gauge("kvoice_reminders_running", "1 while a reminder fan-out is in progress")
+REMINDER_UPLOADS = metrics.counter("kvoice_reminder_audio_uploads_total", "Lesson audio files uploaded (later sends reuse file_id)")
+
+
+def reminder_text(user):
+    """Reminder body for a user row (user_id, first_name, lesson_index)."""
+    name = user.get("first_name") or ""
+    lesson = get_lesson(user.get("lesson_index") or 0)
+    if lesson:
+        number, romanized, hangul, spanish = lesson
+        return (
+            f"🔔 ¡Hola {name}! Hoy todavía no has practicado coreano.\n"
+            f"🎯 Lección {number}/{len(LESSONS)}: {hangul} ({romanized}) - {spanish}\n"
+            f"🎙 Escucha y responde con una nota de voz."
+        )
+    return f"🔔 ¡Hola {name}! Te echo de menos. ¿Charlamos un rato en coreano? 🎙"
+
+
+class ReminderState:
+    """
+    Progress of the daily fan-out, persisted as JSON after every batch so a
+    restart resumes after the last finished batch instead of starting over.
+    Uploaded audio file_ids (the lesson audio never changes) and the users who
+    blocked the bot survive across days.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {
+            "day": None, "cursor": 0, "done": False, "sent": 0, "blocked": 0, "failed": 0,
+            "file_ids": {}, "blocked_users": []
+        }
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.data.update(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable reminder state {path}: {e}")
+
+    def start_day(self, day):
+        """Resets counters for a new day; keeps them when resuming the same day."""
+        if self.data["day"] != day:
+            self.data.update({"day": day, "cursor": 0, "done": False, "sent": 0, "blocked": 0, "failed": 0})
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+class ReminderService:
+    """
+    Daily practice reminders for users inactive between `inactive_hours` and
+    `max_inactive_days`. Users are paged by user_id (keyset) and sent through
+    the outbox at BULK priority, paced to `rate` messages per second and paused
+    while `should_pause()` is true (e.g. the load governor is degraded).
+    Each lesson phrase is synthesized and uploaded once; every other
+    reminder for that lesson reuses the Telegram file_id.
+    """
+
+    def __init__(self, db_service, outbox, audio_service, state_path,
+                 inactive_hours=24, max_inactive_days=14, rate=10.0, batch_size=50,
+                 concurrency=5, should_pause=None):
+        self.db_service = db_service
+        self.outbox = outbox
+        self.audio_service = audio_service
+        self.state = ReminderState(state_path)
+        self.inactive_hours = inactive_hours
+        self.max_inactive_days = max_inactive_days
+        self.rate = rate
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.should_pause = should_pause or (lambda: False)
+        # phrase -> local mp3 rendered for this run
+        self._rendered = {}
+        self._upload_locks = {}
+        self._blocked = set(self.state.data["blocked_users"])
+
+    @property
+    def file_ids(self):
+        return self.state.data["file_ids"]
+
+    def status(self):
+        return dict(self.state.data, file_ids=len(self.file_ids), blocked_users=len(self._blocked))
+
+    def unblock(self, user_id):
+        """The user wrote to the bot again, so they can receive reminders again."""
+        if user_id in self._blocked:
+            self._blocked.discard(user_id)
+            self.state.data["blocked_users"] = sorted(self._blocked)
+            self.state.save()
+
+    async def run(self, day=None):
+        """Sends today's reminders (resuming if a run for today was interrupted)."""
+        day = day or date.today().isoformat()
+        self.state.start_day(day)
+        if self.state.data["done"]:
+            logger.info(f"Reminders for {day} already sent")
+            return
+
+        now = datetime.now(timezone.utc)
+        active_before = now - timedelta(hours=self.inactive_hours)
+        active_after = now - timedelta(days=self.max_inactive_days)
+        REMINDER_RUNNING.set(1)
+        logger.info(f"Reminder run for {day} starting after user_id {self.state.data['cursor']}")
+        try:
+            with tracing.span("reminders.run", day=day):
+                while True:
+                    users = await self.db_service.afetch_inactive_users(
+                        active_before, active_after, after_user_id=self.state.data["cursor"], limit=self.batch_size
+                    )
+                    if not users:
+                        break
+                    await self._send_batch([user for user in users if user["user_id"] not in self._blocked])
+                    self.state.data["cursor"] = users[-1]["user_id"]
+                    self.state.data["blocked_users"] = sorted(self._blocked)
+                    self.state.save()
+                    processed = self.state.data["sent"] + self.state.data["blocked"] + self.state.data["failed"]
+                    REMINDER_PROGRESS.set(processed)
+                    logger.info(
+                        f"Reminders {day}: {processed} processed (sent {self.state.data['sent']}, "
+                        f"blocked {self.state.data['blocked']}, failed {self.state.data['failed']}), "
+                        f"cursor {self.state.data['cursor']}"
+                    )
+                    if len(users) < self.batch_size:
+                        break
+            self.state.data["done"] = True
+            self.state.save()
+            logger.info(f"Reminder run for {day} finished")
+        finally:
+            REMINDER_RUNNING.set(0)
+            self.audio_service.cleanup_files(*self._rendered.values())
+            self._rendered.clear()
+
+    async def _send_batch(self, users):
+        """Paces sends to `rate`/s with at most `concurrency` in flight; returns when all settled."""
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = []
+        interval = 1.0 / self.rate
+        next_at = time.monotonic()
+        for user in users:
+            while self.should_pause():
+                await asyncio.sleep(5)
+                next_at = time.monotonic()
+            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+            next_at = max(next_at, time.monotonic()) + interval
+            await slots.acquire()
+            task = asyncio.create_task(self._send_one(user))
+            task.add_done_callback(lambda _: slots.release())
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+
+    async def _send_one(self, user):
+        try:
+            phrase = reference_text(user.get("lesson_index") or 0)
+            if phrase:
+                await self._send_lesson_audio(user["user_id"], phrase, reminder_text(user))
+            else:
+                await self.outbox.send(user["user_id"], "send_message", priority=BULK, text=reminder_text(user))
+            outcome = "sent"
+        except Forbidden:
+            # User blocked the bot or deleted the chat: skipped by later runs until they write again
+            outcome = "blocked"
+            self._blocked.add(user["user_id"])
+        except Exception as e:
+            logger.warning(f"Reminder to {user['user_id']} failed: {e}")
+            outcome = "failed"
+        self.state.data[outcome] += 1
+        REMINDERS.inc(outcome=outcome)
+
+    async def _render(self, phrase):
+        """TTS of a lesson phrase, once per run."""
+        path = self._rendered.get(phrase)
+        if path is None:
+            path = await self.audio_service.generate_tts(phrase, output_file=f"reminder_{uuid.uuid4()}.mp3")
+            self._rendered[phrase] = path
+        return path
+
+    async def _send_lesson_audio(self, chat_id, phrase, caption):
+        file_id = self.file_ids.get(phrase)
+        if file_id is None:
+            # The first send of a phrase uploads it; concurrent sends of the same phrase wait for its file_id
+            async with self._upload_locks.setdefault(phrase, asyncio.Lock()):
+                file_id = self.file_ids.get(phrase)
+                if file_id is None:
+                    message = await self.outbox.send(
+                        chat_id, "send_voice", priority=BULK, voice=Path(await self._render(phrase)), caption=caption
+                    )
+                    REMINDER_UPLOADS.inc()
+                    if message and message.voice:
+                        self.file_ids[phrase] = message.voice.file_id
+                    return
+        try:
+            await self.outbox.send(chat_id, "send_voice", priority=BULK, voice=file_id, caption=caption)
+        except BadRequest as e:
+            if self.file_ids.get(phrase) != file_id:
+                raise
+            # Stale file_id (e.g. the bot token changed): upload again
+            logger.warning(f"Cached reminder audio for '{phrase}' rejected ({e}), re-uploading")
+            self.file_ids.pop(phrase, None)
+            await self._send_lesson_audio(chat_id, phrase, caption)
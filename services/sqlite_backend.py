@@ -0,0 +1,240 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "schema.sql")
+
+# Statements are module constants so sqlite3's per-connection statement cache
+# reuses the compiled (prepared) form on every call.
+UPSERT_USER_SQL = """
+INSERT INTO users (user_id, username, first_name, last_active)
+VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+ON CONFLICT(user_id) DO UPDATE SET
+    username = excluded.username,
+    first_name = excluded.first_name,
+    last_active = CURRENT_TIMESTAMP
+"""
+
+INSERT_INTERACTION_SQL = """
+INSERT INTO interactions (
+    user_id, role, content_text, content_audio_path,
+    transcription, transcription_romanized, pronunciation_score, feedback_text
+) VALUES (:user_id, :role, :content_text, :content_audio_path,
+          :transcription, :transcription_romanized, :pronunciation_score, :feedback_text)
+"""
+
+SELECT_PROGRESS_SQL = """
+SELECT lesson_index, phrase_stats, total_attempts, updated_at
+FROM user_progress WHERE user_id = ?
+"""
+
+UPSERT_PROGRESS_SQL = """
+INSERT INTO user_progress (user_id, lesson_index, phrase_stats, total_attempts, updated_at)
+VALUES (:user_id, :lesson_index, :phrase_stats, :total_attempts, :updated_at)
+ON CONFLICT(user_id) DO UPDATE SET
+    lesson_index = excluded.lesson_index,
+    phrase_stats = excluded.phrase_stats,
+    total_attempts = excluded.total_attempts,
+    updated_at = excluded.updated_at
+"""
+
+# Uses idx_interactions_user_created (user_id, created_at DESC)
+SELECT_RECENT_SQL = """
+SELECT {columns} FROM interactions
+WHERE user_id = ?
+ORDER BY created_at DESC, id DESC
+LIMIT ?
+"""
+
+# Keyset export pages, one statement per (scope, first page / after cursor) so every
+# variant is a plain predicate the planner can serve from an index without a sort:
+# per-user pages range-scan idx_interactions_user_created (only rows sharing a timestamp are
+# sorted by id), global pages walk idx_interactions_created_id.
+SELECT_PAGE_SQL = {
+    (False, False): """
+SELECT {columns} FROM interactions
+ORDER BY created_at, id
+LIMIT ?
+""",
+    (False, True): """
+SELECT {columns} FROM interactions
+WHERE (created_at, id) > (?, ?)
+ORDER BY created_at, id
+LIMIT ?
+""",
+    (True, False): """
+SELECT {columns} FROM interactions
+WHERE user_id = ?
+ORDER BY created_at, id
+LIMIT ?
+""",
+    (True, True): """
+SELECT {columns} FROM interactions
+WHERE user_id = ? AND (created_at, id) > (?, ?)
+ORDER BY created_at, id
+LIMIT ?
+""",
+}
+
+# Reminder candidates: keyset on user_id, range on idx_users_last_active
+SELECT_INACTIVE_SQL = """
+SELECT u.user_id, u.first_name, COALESCE(p.lesson_index, 0) AS lesson_index
+FROM users u LEFT JOIN user_progress p ON p.user_id = u.user_id
+WHERE u.last_active < ? AND u.last_active >= ? AND u.user_id > ?
+ORDER BY u.user_id
+LIMIT ?
+"""
+
+# CURRENT_TIMESTAMP format (UTC) used by the last_active column
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_STOP = object()
+
+class SQLiteBackend:
+    """
+    Local storage backend on the bundled SQLite schema.
+    Reads use one WAL connection per thread; all writes are serialized
+    through a single dedicated writer thread and connection.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = queue.Queue()
+
+        # Schema + WAL are set up once on the writer connection
+        self._writer_conn = self._connect()
+        with open(SCHEMA_PATH, encoding="utf-8") as f:
+            self._writer_conn.executescript(f.read())
+        self._writer_conn.commit()
+
+        self._writer = threading.Thread(target=self._writer_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+        logger.info(f"Using local SQLite database at {path} (WAL mode).")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=64)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _reader(self):
+        """Per-thread read connection (WAL lets readers run alongside the writer)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    # --- Writer thread ---
+
+    def _writer_loop(self):
+        while True:
+            item = self._writes.get()
+            if item is _STOP:
+                break
+            sql, params, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                cursor = self._writer_conn.execute(sql, params)
+                self._writer_conn.commit()
+                future.set_result(cursor.rowcount)
+            except Exception as e:
+                self._writer_conn.rollback()
+                future.set_exception(e)
+        self._writer_conn.close()
+
+    def submit_write(self, sql, params) -> Future:
+        """Queues a write for the writer thread; returns a concurrent Future."""
+        future = Future()
+        self._writes.put((sql, params, future))
+        return future
+
+    # --- Backend API ---
+
+    def upsert_user(self, user_id, username, first_name):
+        self.submit_write(UPSERT_USER_SQL, (user_id, username, first_name)).result()
+
+    def insert_interaction(self, data):
+        self.submit_write(INSERT_INTERACTION_SQL, data).result()
+
+    def fetch_recent(self, user_id, limit, columns):
+        """Newest-first interactions for a user."""
+        rows = self._reader().execute(SELECT_RECENT_SQL.format(columns=columns), (user_id, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def fetch_progress(self, user_id):
+        row = self._reader().execute(SELECT_PROGRESS_SQL, (user_id,)).fetchone()
+        if row is None:
+            return None
+        progress = dict(row)
+        progress["phrase_stats"] = json.loads(progress["phrase_stats"] or "{}")
+        return progress
+
+    def upsert_progress(self, progress):
+        params = dict(progress)
+        params["phrase_stats"] = json.dumps(progress["phrase_stats"], ensure_ascii=False)
+        self.submit_write(UPSERT_PROGRESS_SQL, params).result()
+
+    def fetch_page(self, user_id, batch_size, cursor, columns):
+        """One keyset page ordered by (created_at, id), strictly after cursor."""
+        params = ([user_id] if user_id is not None else []) + (list(cursor) if cursor else []) + [batch_size]
+        sql = SELECT_PAGE_SQL[user_id is not None, bool(cursor)]
+        rows = self._reader().execute(sql.format(columns=columns), params).fetchall()
+        return [dict(row) for row in rows]
+
+    def fetch_inactive_users(self, active_before, active_after, after_user_id, limit):
+        """Users last active in [active_after, active_before) with user_id > after_user_id, by user_id."""
+        rows = self._reader().execute(SELECT_INACTIVE_SQL, (
+            active_before.strftime(TIMESTAMP_FORMAT), active_after.strftime(TIMESTAMP_FORMAT), after_user_id, limit
+        )).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        self._writes.put(_STOP)
+        self._writer.join(timeout=5)
+
+    # --- Async API ---
+    # Writes await the writer thread's future directly (no executor hop);
+    # reads are sub-millisecond local index lookups and run inline.
+
+    async def aupsert_user(self, user_id, username, first_name):
+        await asyncio.wrap_future(self.submit_write(UPSERT_USER_SQL, (user_id, username, first_name)))
+
+    async def ainsert_interaction(self, data):
+        await asyncio.wrap_future(self.submit_write(INSERT_INTERACTION_SQL, data))
+
+    async def afetch_recent(self, user_id, limit, columns):
+        return self.fetch_recent(user_id, limit, columns)
+
+    async def afetch_progress(self, user_id):
+        return self.fetch_progress(user_id)
+
+    async def aupsert_progress(self, progress):
+        params = dict(progress)
+        params["phrase_stats"] = json.dumps(progress["phrase_stats"], ensure_ascii=False)
+        await asyncio.wrap_future(self.submit_write(UPSERT_PROGRESS_SQL, params))
+
+    async def afetch_inactive_users(self, active_before, active_after, after_user_id, limit):
+        return self.fetch_inactive_users(active_before, active_after, after_user_id, limit)
+
+    def pool_stats(self):
+        return {
+            "backend": self.name,
+            "pending_writes": self._writes.qsize()
+        }
+
+    async def aclose(self):
+        self.close()
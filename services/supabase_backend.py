@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import time
+import httpx
+from supabase import create_client, Client
+
+from config import SUPABASE_URL, SUPABASE_KEY, DB_POOL_SIZE, DB_MAX_CONCURRENCY, DB_TIMEOUT
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+DB_INFLIGHT = metrics.gauge("kvoice_db_inflight", "Async DB requests currently running")
+DB_WAIT = metrics.histogram("kvoice_db_wait_seconds", "Time spent waiting for a DB concurrency slot")
+DB_LATENCY = metrics.histogram("kvoice_db_request_seconds", "Async DB request latency by operation")
+DB_ERRORS = metrics.counter("kvoice_db_errors_total", "Async DB request failures by operation")
+
+def _flatten_inactive(row):
+    """Embedded user_progress (object, list or null) -> flat lesson_index like the SQLite query."""
+    progress = row.pop("user_progress", None)
+    if isinstance(progress, list):
+        progress = progress[0] if progress else None
+    row["lesson_index"] = (progress or {}).get("lesson_index") or 0
+    return row
+
+class SupabaseBackend:
+    """Storage backend talking to Supabase (PostgREST) over HTTP."""
+
+    name = "supabase"
+
+    def __init__(self):
+        self.supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        # Async PostgREST client: created lazily inside the bot's event loop
+        self._http = None
+        self._slots = None
+        logger.info("Connected to Supabase Cloud.")
+
+    def upsert_user(self, user_id, username, first_name):
+        data = {
+            "user_id": user_id,
+            "username": username,
+            "first_name": first_name,
+            "last_active": "now()"
+        }
+        # upsert provided by Supabase client
+        self.supabase.table("users").upsert(data).execute()
+
+    def insert_interaction(self, data):
+        self.supabase.table("interactions").insert(data).execute()
+
+    def fetch_recent(self, user_id, limit, columns):
+        """Newest-first interactions for a user."""
+        response = self.supabase.table("interactions")\
+            .select(columns)\
+            .eq("user_id", user_id)\
+            .order("created_at", desc=True)\
+            .limit(limit)\
+            .execute()
+        return response.data
+
+    def fetch_progress(self, user_id):
+        response = self.supabase.table("user_progress")\
+            .select("lesson_index, phrase_stats, total_attempts, updated_at")\
+            .eq("user_id", user_id)\
+            .limit(1)\
+            .execute()
+        return response.data[0] if response.data else None
+
+    def upsert_progress(self, progress):
+        self.supabase.table("user_progress").upsert(progress).execute()
+
+    def fetch_page(self, user_id, batch_size, cursor, columns):
+        """One keyset page ordered by (created_at, id), strictly after cursor."""
+        query = self.supabase.table("interactions")\
+            .select(columns)\
+            .order("created_at")\
+            .order("id")\
+            .limit(batch_size)
+        if user_id is not None:
+            query = query.eq("user_id", user_id)
+        if cursor:
+            created_at, last_id = cursor
+            # Strictly after the last row seen: (created_at, id) > cursor
+            query = query.or_(
+                f'created_at.gt."{created_at}",'
+                f'and(created_at.eq."{created_at}",id.gt.{last_id})'
+            )
+        return query.execute().data
+
+    def fetch_inactive_users(self, active_before, active_after, after_user_id, limit):
+        """Users last active in [active_after, active_before) with user_id > after_user_id, by user_id."""
+        response = self.supabase.table("users")\
+            .select("user_id, first_name, user_progress(lesson_index)")\
+            .lt("last_active", active_before.isoformat())\
+            .gte("last_active", active_after.isoformat())\
+            .gt("user_id", after_user_id)\
+            .order("user_id")\
+            .limit(limit)\
+            .execute()
+        return [_flatten_inactive(row) for row in response.data]
+
+    def close(self):
+        pass
+
+    # --- Async API (pooled HTTP/2 client, no executor threads) ---
+
+    def _client(self):
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=f"{SUPABASE_URL}/rest/v1",
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=DB_POOL_SIZE,
+                    max_keepalive_connections=DB_POOL_SIZE,
+                    keepalive_expiry=60
+                ),
+                timeout=DB_TIMEOUT,
+                headers={
+                    "apikey": SUPABASE_KEY,
+                    "Authorization": f"Bearer {SUPABASE_KEY}"
+                }
+            )
+            self._slots = asyncio.Semaphore(DB_MAX_CONCURRENCY)
+            logger.info(f"Async Supabase pool ready (connections={DB_POOL_SIZE}, concurrency={DB_MAX_CONCURRENCY})")
+        return self._http
+
+    async def _request(self, op, method, path, **kwargs):
+        client = self._client()
+        wait_start = time.perf_counter()
+        async with self._slots:
+            DB_WAIT.observe(time.perf_counter() - wait_start, backend=self.name)
+            DB_INFLIGHT.inc(backend=self.name)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                response.raise_for_status()
+                return response.json() if response.content else None
+            except Exception:
+                DB_ERRORS.inc(backend=self.name, op=op)
+                raise
+            finally:
+                DB_INFLIGHT.dec(backend=self.name)
+                DB_LATENCY.observe(time.perf_counter() - start, backend=self.name, op=op)
+
+    async def aupsert_user(self, user_id, username, first_name):
+        data = {
+            "user_id": user_id,
+            "username": username,
+            "first_name": first_name,
+            "last_active": "now()"
+        }
+        await self._request("upsert_user", "POST", "/users", json=data,
+                            headers={"Prefer": "resolution=merge-duplicates,return=minimal"})
+
+    async def ainsert_interaction(self, data):
+        await self._request("insert_interaction", "POST", "/interactions", json=data,
+                            headers={"Prefer": "return=minimal"})
+
+    async def afetch_recent(self, user_id, limit, columns):
+        params = {
+            "select": columns.replace(" ", ""),
+            "user_id": f"eq.{user_id}",
+            "order": "created_at.desc",
+            "limit": limit
+        }
+        return await self._request("fetch_recent", "GET", "/interactions", params=params)
+
+    async def afetch_progress(self, user_id):
+        params = {
+            "select": "lesson_index,phrase_stats,total_attempts,updated_at",
+            "user_id": f"eq.{user_id}",
+            "limit": 1
+        }
+        rows = await self._request("fetch_progress", "GET", "/user_progress", params=params)
+        return rows[0] if rows else None
+
+    async def aupsert_progress(self, progress):
+        await self._request("upsert_progress", "POST", "/user_progress", json=progress,
+                            headers={"Prefer": "resolution=merge-duplicates,return=minimal"})
+
+    async def afetch_inactive_users(self, active_before, active_after, after_user_id, limit):
+        params = [
+            ("select", "user_id,first_name,user_progress(lesson_index)"),
+            ("last_active", f"lt.{active_before.isoformat()}"),
+            ("last_active", f"gte.{active_after.isoformat()}"),
+            ("user_id", f"gt.{after_user_id}"),
+            ("order", "user_id"),
+            ("limit", limit)
+        ]
+        rows = await self._request("fetch_inactive_users", "GET", "/users", params=params)
+        return [_flatten_inactive(row) for row in rows]
+
+    def pool_stats(self):
+        in_flight = DB_INFLIGHT.get(backend=self.name)
+        return {
+            "backend": self.name,
+            "pool_size": DB_POOL_SIZE,
+            "max_concurrency": DB_MAX_CONCURRENCY,
+            "in_flight": in_flight,
+            "free_slots": DB_MAX_CONCURRENCY - in_flight
+        }
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import httpx
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest
+
+from services import metrics, tracing
+
+POOL_WAIT = metrics.histogram("kvoice_telegram_pool_wait_seconds", "Time Bot API calls waited for a free connection, by pool")
+POOL_INFLIGHT = metrics.gauge("kvoice_telegram_pool_inflight", "Bot API calls holding a connection, by pool")
+POOL_TIMEOUTS = metrics.counter("kvoice_telegram_pool_timeouts_total", "Calls that gave up waiting for a connection, by pool")
+DOWNLOAD_BYTES = metrics.counter("kvoice_telegram_download_bytes_total", "Bytes downloaded from Telegram file storage")
+
+
+class PoolGate:
+    """
+    One slot per pooled connection: waiting here is waiting for the pool,
+    so the wait is measurable (httpx doesn't expose it) and bounded by `timeout`.
+    """
+
+    def __init__(self, name, size, timeout=None):
+        self.name = name
+        self.size = size
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(size)
+
+    async def __aenter__(self):
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            POOL_TIMEOUTS.inc(pool=self.name)
+            raise TimedOut(f"Pool timeout: all {self.size} connections of the '{self.name}' pool are busy")
+        POOL_WAIT.observe(time.perf_counter() - start, pool=self.name)
+        POOL_INFLIGHT.inc(pool=self.name)
+
+    async def __aexit__(self, *exc_info):
+        POOL_INFLIGHT.dec(pool=self.name)
+        self._slots.release()
+
+
+class TracedHTTPXRequest(HTTPXRequest):
+    """
+    HTTPXRequest that records every Bot API call as a span (telegram.<method>)
+    and exports pool wait/in-flight metrics under `pool_name`.
+    """
+
+    def __init__(self, pool_name="bot", connection_pool_size=1, pool_timeout=1.0, **kwargs):
+        super().__init__(connection_pool_size=connection_pool_size, pool_timeout=pool_timeout, **kwargs)
+        self.pool_name = pool_name
+        self._gate = PoolGate(pool_name, connection_pool_size, pool_timeout)
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        async with self._gate:
+            with tracing.span(f"telegram.{endpoint}", http_method=method, pool=self.pool_name):
+                return await super().do_request(url, method, request_data, *args, **kwargs)
+
+
+class FileDownloader:
+    """
+    Downloads Telegram files into memory on its own connection pool, so large
+    voice downloads never queue behind (or block) replies on the send pool.
+    """
+
+    def __init__(self, pool_size=16, timeout=30.0, pool_timeout=5.0, max_bytes=20 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._gate = PoolGate("download", pool_size, pool_timeout)
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(timeout, pool=pool_timeout)
+        )
+
+    async def download(self, file_url):
+        """Returns the file's bytes (`file_url` is File.file_path from get_file)."""
+        async with self._gate:
+            with tracing.span("telegram.download") as span:
+                async with self._client.stream("GET", file_url) as response:
+                    response.raise_for_status()
+                    chunks = []
+                    size = 0
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            raise ValueError(f"File larger than {self.max_bytes} bytes")
+                        chunks.append(chunk)
+                span.set(bytes=size)
+        DOWNLOAD_BYTES.inc(size)
+        return b"".join(chunks)
+
+    async def aclose(self):
+        await self._client.aclose()
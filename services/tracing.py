@@ -0,0 +1,187 @@
+"""
+Lightweight request tracing.
+
+Each Telegram update gets a trace; spans nest through a ContextVar, so they
+follow `await`, `asyncio.create_task` and `asyncio.to_thread` (all of which
+copy the current context), including fire-and-forget DB writes.
+Finished spans are appended to a local JSON Lines file using OTLP field
+names (see analyze_traces.py for reports and OTLP/JSON conversion); the file
+is rotated by size so a long-running bot keeps a bounded amount of history.
+"""
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("kvoice_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "status", "_token")
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.status = "OK"
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_record(self):
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+
+class JsonlSpanExporter:
+    """
+    Appends finished spans to a JSONL file; buffered and thread-safe.
+    Once the file reaches `max_bytes` it is rotated to path.1 ... path.<backups>
+    (oldest dropped), like logging's RotatingFileHandler.
+    """
+
+    def __init__(self, path, flush_every=50, flush_interval=2.0, max_bytes=50 * 1024 * 1024, backups=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush)
+
+    def export(self, span):
+        line = json.dumps(span.to_record(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._buffer.append(line)
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+            if len(self._buffer) < self.flush_every and not due:
+                return
+            lines, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+            self._write(lines)
+
+    def flush(self):
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+            self._write(lines)
+
+    def _write(self, lines):
+        if not lines:
+            return
+        try:
+            self._rotate_if_full()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            logging.getLogger(__name__).warning(f"Failed to export {len(lines)} spans: {e}")
+
+    def _rotate_if_full(self):
+        if not self.max_bytes or not os.path.exists(self.path) or os.path.getsize(self.path) < self.max_bytes:
+            return
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+_exporter = None
+
+
+def configure(path, max_bytes=50 * 1024 * 1024, backups=3):
+    """Enables span export to `path` (None disables tracing output), rotated at `max_bytes`."""
+    global _exporter
+    _exporter = JsonlSpanExporter(path, max_bytes=max_bytes, backups=backups) if path else None
+
+
+def current_span():
+    return _current.get()
+
+
+def current_trace_id():
+    span = _current.get()
+    return span.trace_id if span else None
+
+
+def start_span(name, **attributes):
+    """Opens a span as a child of the current one (or a new trace) and makes it current."""
+    span = Span(name, parent=_current.get(), attributes=attributes)
+    span._token = _current.set(span)
+    return span
+
+
+def end_span(span, error=None):
+    """Closes a span opened with start_span and restores its parent."""
+    if span.end_ns is not None:
+        return
+    span.end_ns = time.time_ns()
+    if error is not None:
+        span.status = "ERROR"
+        span.attributes["error"] = f"{type(error).__name__}: {error}"
+    try:
+        _current.reset(span._token)
+    except ValueError:
+        # Ended from a different context (e.g. another handler group); just detach
+        if _current.get() is span:
+            _current.set(None)
+    if _exporter:
+        _exporter.export(span)
+
+
+@contextmanager
+def span(name, **attributes):
+    """`with span("gemini.analyze_audio", user_id=...):` - works in sync and async code."""
+    active = start_span(name, **attributes)
+    try:
+        yield active
+    except BaseException as e:
+        end_span(active, error=e)
+        raise
+    end_span(active)
+
+
+def traced(name):
+    """Decorator: runs an async function inside a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Every log record carries the active trace id (use %(trace_id)s in formats)
+_base_record_factory = logging.getLogRecordFactory()
+
+def _record_factory(*args, **kwargs):
+    record = _base_record_factory(*args, **kwargs)
+    span = _current.get()
+    record.trace_id = span.trace_id[:16] if span else "-"
+    return record
+
+logging.setLogRecordFactory(_record_factory)
@@ -0,0 +1,272 @@
+import asyncio
+import io
+import logging
+import math
+import os
+import struct
+import time
+import wave
+
+from services import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+TTS_LATENCY = metrics.histogram("kvoice_tts_seconds", "TTS synthesis latency by engine and outcome")
+TTS_HEDGES = metrics.counter("kvoice_tts_hedges_total", "Backup engines started because the primary missed the deadline")
+TTS_FAILOVERS = metrics.counter("kvoice_tts_failovers_total", "Backup engines started because an engine failed")
+TTS_WINS = metrics.counter("kvoice_tts_wins_total", "Replies served by each engine")
+TTS_HEALTH = metrics.gauge("kvoice_tts_health_score", "Engine health score (lower is better)")
+TTS_PROBES = metrics.counter("kvoice_tts_probes_total", "Background syntheses re-measuring engines that aren't serving replies")
+
+
+class EdgeTTSEngine:
+    """Microsoft Edge neural voices (default, best quality)."""
+
+    name = "edge"
+
+    def __init__(self, voice="ko-KR-SunHiNeural", rate="-20%"):
+        # VOICE SELECTION:
+        # ko-KR-SunHiNeural (Female)
+        # ko-KR-InJoonNeural (Male)
+        self.voice = voice
+        # Rate -20% for beginners
+        self.rate = rate
+
+    async def synthesize(self, text, path):
+        import edge_tts
+        communicate = edge_tts.Communicate(text, self.voice, rate=self.rate)
+        await communicate.save(path)
+
+
+class GTTSEngine:
+    """Google Translate TTS (gTTS): lower quality, independent infrastructure."""
+
+    name = "gtts"
+
+    def __init__(self, lang="ko"):
+        self.lang = lang
+
+    async def synthesize(self, text, path):
+        from gtts import gTTS
+
+        def render():
+            buffer = io.BytesIO()
+            gTTS(text, lang=self.lang).write_to_fp(buffer)
+            return buffer.getvalue()
+
+        # Render in memory so a cancelled (hedged-out) call never leaves a file behind
+        data = await asyncio.to_thread(render)
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+class LocalToneEngine:
+    """
+    Offline stand-in for tests and air-gapped runs: writes a short WAV tone
+    whose length follows the text. No network, no ffmpeg.
+    """
+
+    name = "local"
+
+    def __init__(self, sample_rate=16000, ms_per_char=120):
+        self.sample_rate = sample_rate
+        self.ms_per_char = ms_per_char
+
+    async def synthesize(self, text, path):
+        frames = int(self.sample_rate * max(0.3, len(text) * self.ms_per_char / 1000))
+        samples = (int(8000 * math.sin(2 * math.pi * 440 * i / self.sample_rate)) for i in range(frames))
+        with wave.open(path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(self.sample_rate)
+            f.writeframes(b"".join(struct.pack("<h", s) for s in samples))
+
+
+ENGINE_TYPES = {
+    "edge": EdgeTTSEngine,
+    "gtts": GTTSEngine,
+    "local": LocalToneEngine,
+}
+
+
+def build_engines(names):
+    """"edge,gtts" -> [EdgeTTSEngine(), GTTSEngine()] (unknown names are ignored)."""
+    engines = []
+    for name in names:
+        engine_type = ENGINE_TYPES.get(name.strip().lower())
+        if engine_type is None:
+            logger.warning(f"Unknown TTS engine '{name}' ignored")
+            continue
+        engines.append(engine_type())
+    return engines
+
+
+class EngineHealth:
+    """EWMA latency and failure rate; repeated failures put the engine in cooldown."""
+
+    def __init__(self, prior_latency=1.0, alpha=0.3, cooldown=60.0, max_failures=3):
+        self.latency = prior_latency
+        self.failure_rate = 0.0
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self.max_failures = max_failures
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.last_sample = time.monotonic()
+
+    def success(self, seconds):
+        self.latency = self.alpha * seconds + (1 - self.alpha) * self.latency
+        self.failure_rate *= (1 - self.alpha)
+        self.consecutive_failures = 0
+        self.last_sample = time.monotonic()
+
+    def cancelled(self, seconds):
+        """Lost a hedge race after `seconds`: its real latency is at least that long."""
+        if seconds > self.latency:
+            self.latency = self.alpha * seconds + (1 - self.alpha) * self.latency
+        self.last_sample = time.monotonic()
+
+    def failure(self, seconds):
+        self.latency = self.alpha * seconds + (1 - self.alpha) * self.latency
+        self.last_sample = time.monotonic()
+        self.failure_rate = self.alpha + (1 - self.alpha) * self.failure_rate
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.max_failures:
+            self.cooldown_until = time.monotonic() + self.cooldown
+
+    @property
+    def score(self):
+        penalty = 1000.0 if time.monotonic() < self.cooldown_until else 0.0
+        return self.latency * (1 + 4 * self.failure_rate) + penalty
+
+
+class TTSService:
+    """
+    Synthesizes with the healthiest engine first. If it hasn't finished after
+    `hedge_after` seconds the next engine is started in parallel (hedging);
+    if it fails, the next one starts immediately (failover). First success wins.
+    Engines that haven't run for `probe_interval` seconds are re-measured in the
+    background with the current text, so a recovered engine can take the lead again.
+    """
+
+    def __init__(self, engines, hedge_after=2.5, probe_interval=300.0):
+        if not engines:
+            raise ValueError("TTSService needs at least one engine")
+        self.engines = engines
+        self.hedge_after = hedge_after
+        self.probe_interval = probe_interval
+        # Configured order is the tie-breaker: earlier engines start with a lower prior latency
+        self.health = {engine.name: EngineHealth(prior_latency=1.0 + 0.1 * i) for i, engine in enumerate(engines)}
+        self._probes = set()
+
+    def ranked(self):
+        return sorted(self.engines, key=lambda engine: self.health[engine.name].score)
+
+    async def _run(self, engine, text, path):
+        start = time.perf_counter()
+        try:
+            with tracing.span("tts.engine", engine=engine.name):
+                await engine.synthesize(text, path)
+        except asyncio.CancelledError:
+            elapsed = time.perf_counter() - start
+            self.health[engine.name].cancelled(elapsed)
+            TTS_LATENCY.observe(elapsed, engine=engine.name, outcome="cancelled")
+            TTS_HEALTH.set(round(self.health[engine.name].score, 3), engine=engine.name)
+            raise
+        except Exception:
+            elapsed = time.perf_counter() - start
+            self.health[engine.name].failure(elapsed)
+            TTS_LATENCY.observe(elapsed, engine=engine.name, outcome="error")
+            TTS_HEALTH.set(round(self.health[engine.name].score, 3), engine=engine.name)
+            raise
+        elapsed = time.perf_counter() - start
+        self.health[engine.name].success(elapsed)
+        TTS_LATENCY.observe(elapsed, engine=engine.name, outcome="ok")
+        TTS_HEALTH.set(round(self.health[engine.name].score, 3), engine=engine.name)
+
+    async def _probe(self, engine, text, path):
+        try:
+            await self._run(engine, text, path)
+        except Exception as e:
+            logger.info(f"TTS probe of {engine.name} failed: {e}")
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _schedule_probes(self, ranked, text, base, ext):
+        """Re-measures stale backup engines (out of cooldown) without delaying the reply."""
+        now = time.monotonic()
+        for engine in ranked[1:]:
+            health = self.health[engine.name]
+            if engine.name in self._probes or now - health.last_sample < self.probe_interval or now < health.cooldown_until:
+                continue
+            # Counts as a sample now so concurrent requests don't probe it too
+            health.last_sample = now
+            TTS_PROBES.inc(engine=engine.name)
+            task = asyncio.create_task(self._probe(engine, text, f"{base}.probe-{engine.name}{ext}"))
+            self._probes.add(engine.name)
+            task.add_done_callback(lambda _, name=engine.name: self._probes.discard(name))
+
+    async def synthesize(self, text, output_file):
+        """Writes `text` as speech to output_file; returns the name of the engine that won."""
+        ranked = self.ranked()
+        base, ext = os.path.splitext(output_file)
+        if self.probe_interval:
+            self._schedule_probes(ranked, text, base, ext)
+        pending = {}
+        errors = []
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            engine = ranked[next_index]
+            next_index += 1
+            path = f"{base}.{engine.name}{ext}"
+            pending[asyncio.create_task(self._run(engine, text, path))] = (engine, path)
+
+        launch()
+        try:
+            while pending:
+                can_hedge = next_index < len(ranked)
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_after if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Deadline missed: race the next-best engine against the slow one
+                    TTS_HEDGES.inc()
+                    logger.info(f"TTS hedging: starting {ranked[next_index].name} after {self.hedge_after}s")
+                    launch()
+                    continue
+
+                for task in done:
+                    engine, path = pending.pop(task)
+                    if task.exception() is None:
+                        os.replace(path, output_file)
+                        TTS_WINS.inc(engine=engine.name)
+                        return engine.name
+                    # A failed engine may have left a partial file behind
+                    if os.path.exists(path):
+                        os.remove(path)
+                    errors.append(f"{engine.name}: {task.exception()}")
+                    logger.warning(f"TTS engine {engine.name} failed: {task.exception()}")
+                    if next_index < len(ranked):
+                        TTS_FAILOVERS.inc()
+                        launch()
+        finally:
+            for task, (engine, path) in pending.items():
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            for engine, path in pending.values():
+                if os.path.exists(path):
+                    os.remove(path)
+
+        raise RuntimeError(f"All TTS engines failed ({'; '.join(errors)})")
+
+    def stats(self):
+        return {
+            name: {"latency": round(h.latency, 3), "failure_rate": round(h.failure_rate, 3), "score": round(h.score, 3)}
+            for name, h in self.health.items()
+        }
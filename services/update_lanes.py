@@ -0,0 +1,174 @@
+import asyncio
+import collections
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from telegram.ext import BaseUpdateProcessor
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+LANE_LATENCY = metrics.histogram("kvoice_lane_latency_seconds", "Time from arrival to handler completion, by lane")
+LANE_WAIT = metrics.histogram("kvoice_lane_wait_seconds", "Time waiting for a lane slot, by lane")
+LANE_SLO_BREACHES = metrics.counter("kvoice_lane_slo_breaches_total", "Updates that finished slower than their lane's SLO")
+LANE_RUNNING = metrics.gauge("kvoice_lane_running", "Updates currently executing, by lane")
+LANE_WAITING = metrics.gauge("kvoice_lane_waiting", "Updates queued for a slot, by lane")
+
+
+def parse_lane_setting(value, cast=float):
+    """"interactive:8,text:6,voice:4" -> {"interactive": 8.0, ...}"""
+    result = {}
+    for item in value.split(","):
+        if item.strip():
+            name, number = item.split(":")
+            result[name.strip()] = cast(number)
+    return result
+
+
+def classify_update(update):
+    """Lane for an update: commands and anything non-message are interactive; then voice or text."""
+    message = update.effective_message
+    if message is None:
+        return "interactive"
+    if message.voice or message.audio:
+        return "voice"
+    if message.text and not message.text.startswith("/"):
+        return "text"
+    return "interactive"
+
+
+class Lane:
+    __slots__ = ("name", "limit", "weight", "slo", "running", "waiters", "finish_tag")
+
+    def __init__(self, name, limit, weight, slo):
+        self.name = name
+        self.limit = limit
+        self.weight = weight
+        self.slo = slo
+        self.running = 0
+        self.waiters = collections.deque()
+        # Virtual finish time of the lane's last granted slot (start-time fair queuing)
+        self.finish_tag = 0.0
+
+
+class LaneScheduler:
+    """
+    Runs work in classed lanes. Each lane has its own concurrency limit; all
+    lanes share `workers` slots. When a slot frees up and several lanes are
+    waiting, the next one is picked by weighted fair queuing, so a backlog of
+    voice analyses takes at most its weighted share and never blocks /ping.
+    """
+
+    def __init__(self, limits, weights, slos, workers):
+        self.lanes = {
+            name: Lane(name, int(limit), weights.get(name, 1.0), slos.get(name))
+            for name, limit in limits.items()
+        }
+        self.workers = workers
+        self.running = 0
+        self._virtual_time = 0.0
+
+    def waiting(self):
+        return sum(len(lane.waiters) for lane in self.lanes.values())
+
+    def _start_tag(self, lane):
+        return max(lane.finish_tag, self._virtual_time)
+
+    def _grant(self, lane):
+        start = self._start_tag(lane)
+        self._virtual_time = start
+        lane.finish_tag = start + 1.0 / lane.weight
+        lane.running += 1
+        self.running += 1
+        LANE_RUNNING.set(lane.running, lane=lane.name)
+
+    def _release(self, lane):
+        lane.running -= 1
+        self.running -= 1
+        LANE_RUNNING.set(lane.running, lane=lane.name)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.running < self.workers:
+            ready = [lane for lane in self.lanes.values() if lane.waiters and lane.running < lane.limit]
+            if not ready:
+                return
+            lane = min(ready, key=self._start_tag)
+            waiter = lane.waiters.popleft()
+            LANE_WAITING.set(len(lane.waiters), lane=lane.name)
+            if waiter.cancelled():
+                continue
+            self._grant(lane)
+            waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, name):
+        """Holds one slot of lane `name` for the duration of the block."""
+        lane = self.lanes.get(name) or self.lanes["interactive"]
+        arrived = time.perf_counter()
+
+        # FIFO within a lane: only skip the queue if nobody in this lane is waiting
+        if not lane.waiters and lane.running < lane.limit and self.running < self.workers:
+            self._grant(lane)
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            lane.waiters.append(waiter)
+            LANE_WAITING.set(len(lane.waiters), lane=lane.name)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Granted just as we were cancelled: hand the slot on
+                    self._release(lane)
+                elif waiter in lane.waiters:
+                    lane.waiters.remove(waiter)
+                    LANE_WAITING.set(len(lane.waiters), lane=lane.name)
+                raise
+        LANE_WAIT.observe(time.perf_counter() - arrived, lane=lane.name)
+
+        try:
+            yield
+        finally:
+            self._release(lane)
+            elapsed = time.perf_counter() - arrived
+            LANE_LATENCY.observe(elapsed, lane=lane.name)
+            if lane.slo and elapsed > lane.slo:
+                LANE_SLO_BREACHES.inc(lane=lane.name)
+
+    def stats(self):
+        return {
+            name: {"running": lane.running, "waiting": len(lane.waiters), "limit": lane.limit, "weight": lane.weight}
+            for name, lane in self.lanes.items()
+        }
+
+
+class LaneUpdateProcessor(BaseUpdateProcessor):
+    """
+    Update processor that runs each update's handlers inside its lane.
+    `max_pending` bounds updates admitted (running + queued in lanes);
+    actual concurrency is governed by the LaneScheduler.
+    """
+
+    def __init__(self, scheduler, classify=classify_update, max_pending=512):
+        super().__init__(max_pending)
+        self.scheduler = scheduler
+        self.classify = classify
+
+    async def do_process_update(self, update, coroutine):
+        started = False
+        try:
+            async with self.scheduler.slot(self.classify(update)):
+                started = True
+                await coroutine
+        finally:
+            if not started:
+                # Cancelled while queued: don't leave a never-awaited coroutine behind
+                coroutine.close()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
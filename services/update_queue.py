@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+PERSISTED = metrics.counter("kvoice_update_queue_persisted_total", "Updates written to the durable queue")
+DUPLICATES = metrics.counter("kvoice_update_queue_duplicates_total", "Updates skipped because they were already handled or in flight")
+ACKED = metrics.counter("kvoice_update_queue_acked_total", "Updates acknowledged after processing")
+REPLAYED = metrics.counter("kvoice_update_queue_replayed_total", "Pending updates replayed after a restart")
+PENDING = metrics.gauge("kvoice_update_queue_pending", "Updates persisted but not yet acknowledged")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS updates (
+    update_id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'done', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    received_at REAL NOT NULL,
+    acked_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_updates_status ON updates(status, update_id);
+"""
+
+
+class UpdateQueue:
+    """
+    Append-only local journal of incoming Telegram updates (SQLite, WAL).
+    Updates are persisted before any handler runs and acknowledged once
+    handling completes, so a crash or deploy replays them instead of losing them.
+    """
+
+    def __init__(self, path, max_attempts=3, retention_hours=24, prune_interval=600):
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_hours * 3600
+        self.prune_interval = prune_interval
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._prune()
+
+        # update_id -> asyncio.Task currently handling it
+        self._inflight = {}
+        # update_ids whose handler returned but whose work continues elsewhere (e.g. debounce)
+        self._deferred = set()
+        PENDING.set(self.pending_count())
+        logger.info(f"Durable update queue at {path} ({self.pending_count()} pending)")
+
+    def claim(self, update):
+        """
+        Persists an update and marks it in flight.
+        Returns False if it was already handled or is being handled right now.
+        """
+        update_id = update.update_id
+        # Deferred updates are still pending in the journal but already part of a batch
+        if update_id in self._inflight or update_id in self._deferred:
+            DUPLICATES.inc()
+            return False
+
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO updates (update_id, payload, received_at) VALUES (?, ?, ?)",
+            (update_id, json.dumps(update.to_dict(), ensure_ascii=False), time.time())
+        )
+        self.conn.commit()
+        if cursor.rowcount == 1:
+            PERSISTED.inc()
+            PENDING.inc()
+        else:
+            row = self.conn.execute("SELECT status FROM updates WHERE update_id = ?", (update_id,)).fetchone()
+            if row and row[0] != 'pending':
+                DUPLICATES.inc()
+                return False
+
+        self._inflight[update_id] = asyncio.current_task()
+        return True
+
+    def defer(self, update_id):
+        """The handler returned but the update is still being worked on; ack it later via complete()."""
+        self._deferred.add(update_id)
+
+    def ack(self, update_id):
+        """Acknowledges an update once all its handlers have finished (unless deferred)."""
+        if update_id in self._deferred:
+            self._inflight.pop(update_id, None)
+            return
+        self.complete(update_id)
+
+    def complete(self, *update_ids):
+        for update_id in update_ids:
+            self._deferred.discard(update_id)
+            self._inflight.pop(update_id, None)
+            cursor = self.conn.execute(
+                "UPDATE updates SET status = 'done', acked_at = ? WHERE update_id = ? AND status = 'pending'",
+                (time.time(), update_id)
+            )
+            if cursor.rowcount:
+                ACKED.inc()
+                PENDING.dec()
+        self.conn.commit()
+        # A long-running bot would otherwise keep every payload until the next restart
+        if time.monotonic() - self._last_prune >= self.prune_interval:
+            self._prune()
+
+    def _prune(self):
+        """Acknowledged rows are only kept (for duplicate detection) for the retention window."""
+        self.conn.execute(
+            "DELETE FROM updates WHERE status != 'pending' AND received_at < ?",
+            (time.time() - self.retention_seconds,)
+        )
+        self.conn.commit()
+        self._last_prune = time.monotonic()
+
+    def pending_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM updates WHERE status = 'pending'").fetchone()[0]
+
+    def take_backlog(self):
+        """
+        Returns pending payloads (oldest first) for replay and counts the attempt.
+        Updates that already failed max_attempts times are parked as 'failed'.
+        """
+        self.conn.execute(
+            "UPDATE updates SET status = 'failed' WHERE status = 'pending' AND attempts >= ?",
+            (self.max_attempts,)
+        )
+        rows = self.conn.execute(
+            "SELECT update_id, payload FROM updates WHERE status = 'pending' ORDER BY update_id"
+        ).fetchall()
+        self.conn.execute("UPDATE updates SET attempts = attempts + 1 WHERE status = 'pending'")
+        self.conn.commit()
+        PENDING.set(len(rows))
+        return [(update_id, json.loads(payload)) for update_id, payload in rows]
+
+    async def drain(self, process, workers=4):
+        """Replays the persisted backlog through `process(payload)` with parallel workers."""
+        backlog = self.take_backlog()
+        if not backlog:
+            return
+        logger.info(f"Replaying {len(backlog)} pending updates with {workers} workers")
+        slots = asyncio.Semaphore(workers)
+
+        async def replay(update_id, payload):
+            async with slots:
+                try:
+                    await process(payload)
+                    REPLAYED.inc()
+                except Exception as e:
+                    logger.error(f"Replay of update {update_id} failed: {e}", exc_info=True)
+
+        await asyncio.gather(*(replay(update_id, payload) for update_id, payload in backlog))
+
+    async def wait_idle(self, timeout):
+        """Graceful shutdown: waits for in-flight updates to finish (up to timeout seconds)."""
+        current = asyncio.current_task()
+        tasks = {t for t in self._inflight.values() if t is not None and t is not current and not t.done()}
+        if not tasks:
+            return
+        logger.info(f"Waiting for {len(tasks)} in-flight updates to finish...")
+        done, still_running = await asyncio.wait(tasks, timeout=timeout)
+        if still_running:
+            logger.warning(f"{len(still_running)} updates still running after {timeout}s; they will be replayed on restart")
+
+    def close(self):
+        self.conn.close()
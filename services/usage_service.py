@@ -0,0 +1,139 @@
+import logging
+import threading
+from datetime import date, timedelta
+
+from services import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+TOKENS = metrics.counter("kvoice_gemini_tokens_total", "Gemini tokens by kind (input/output/audio/cached) and call type")
+SECTION_TOKENS = metrics.counter(
+    "kvoice_gemini_prompt_section_tokens_total",
+    "Input tokens attributed to each prompt section (system/instruction/progress/history/audio)"
+)
+CALLS = metrics.counter("kvoice_gemini_calls_total", "Gemini generate_content calls by call type")
+BUDGET_REJECTIONS = metrics.counter("kvoice_budget_rejections_total", "Requests refused because the user's daily budget was spent")
+DAY_TOTAL = metrics.gauge("kvoice_gemini_tokens_today", "Total tokens used today across all users")
+
+# Gemini bills audio input at a fixed rate of 32 tokens per second
+AUDIO_TOKENS_PER_SECOND = 32
+# Days of per-user aggregates kept in memory
+RETENTION_DAYS = 7
+
+
+def _field(obj, name, default=0):
+    value = getattr(obj, name, None)
+    return value if value is not None else default
+
+
+class UsageTracker:
+    """
+    Records token usage of each Gemini call and aggregates it per user and per day.
+    Input tokens are attributed to prompt sections: audio from the response's
+    modality breakdown (or duration * 32 tok/s), the remaining text tokens
+    proportionally to each section's character length.
+    """
+
+    def __init__(self, daily_budget=0):
+        self.daily_budget = daily_budget
+        self._lock = threading.Lock()
+        # (day_iso, user_id) -> aggregate dict
+        self._per_user = {}
+        # day_iso -> aggregate dict
+        self._per_day = {}
+
+    @staticmethod
+    def _empty():
+        return {"calls": 0, "input": 0, "output": 0, "audio": 0, "cached": 0, "total": 0, "sections": {}}
+
+    def record(self, user_id, call_type, response, sections, audio_seconds=None):
+        """
+        response: generate_content response (reads response.usage_metadata)
+        sections: {section_name: char_length} of the text parts of the prompt
+        """
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return None
+
+        input_tokens = _field(usage, "prompt_token_count")
+        output_tokens = _field(usage, "candidates_token_count")
+        cached_tokens = _field(usage, "cached_content_token_count")
+        total_tokens = _field(usage, "total_token_count") or input_tokens + output_tokens
+
+        audio_tokens = 0
+        for detail in _field(usage, "prompt_tokens_details", []) or []:
+            modality = str(_field(detail, "modality", ""))
+            if "AUDIO" in modality.upper():
+                audio_tokens += _field(detail, "token_count")
+        if not audio_tokens and audio_seconds:
+            audio_tokens = min(input_tokens, int(audio_seconds * AUDIO_TOKENS_PER_SECOND))
+
+        # Apportion the text part of the prompt by section size
+        text_tokens = max(0, input_tokens - audio_tokens)
+        total_chars = sum(sections.values()) or 1
+        section_tokens = {name: round(text_tokens * chars / total_chars) for name, chars in sections.items()}
+        if audio_tokens:
+            section_tokens["audio"] = audio_tokens
+
+        entry = {
+            "calls": 1,
+            "input": input_tokens,
+            "output": output_tokens,
+            "audio": audio_tokens,
+            "cached": cached_tokens,
+            "total": total_tokens,
+            "sections": section_tokens
+        }
+
+        today = date.today().isoformat()
+        with self._lock:
+            for bucket in (self._per_user.setdefault((today, user_id), self._empty()),
+                           self._per_day.setdefault(today, self._empty())):
+                for key in ("calls", "input", "output", "audio", "cached", "total"):
+                    bucket[key] += entry[key]
+                for name, tokens in section_tokens.items():
+                    bucket["sections"][name] = bucket["sections"].get(name, 0) + tokens
+            self._prune(today)
+            DAY_TOTAL.set(self._per_day[today]["total"])
+
+        CALLS.inc(call=call_type)
+        TOKENS.inc(input_tokens, kind="input", call=call_type)
+        TOKENS.inc(output_tokens, kind="output", call=call_type)
+        TOKENS.inc(audio_tokens, kind="audio", call=call_type)
+        TOKENS.inc(cached_tokens, kind="cached", call=call_type)
+        for name, tokens in section_tokens.items():
+            SECTION_TOKENS.inc(tokens, section=name)
+
+        span = tracing.current_span()
+        if span:
+            span.set(input_tokens=input_tokens, output_tokens=output_tokens,
+                     audio_tokens=audio_tokens, cached_tokens=cached_tokens)
+        logger.info(
+            f"Gemini usage ({call_type}) user={user_id}: in={input_tokens} out={output_tokens} "
+            f"audio={audio_tokens} cached={cached_tokens} sections={section_tokens}"
+        )
+        return entry
+
+    def _prune(self, today_iso):
+        cutoff = (date.fromisoformat(today_iso) - timedelta(days=RETENTION_DAYS)).isoformat()
+        for key in [k for k in self._per_user if k[0] < cutoff]:
+            del self._per_user[key]
+        for key in [k for k in self._per_day if k < cutoff]:
+            del self._per_day[key]
+
+    def user_today(self, user_id):
+        with self._lock:
+            return dict(self._per_user.get((date.today().isoformat(), user_id), self._empty()))
+
+    def day_totals(self, day=None):
+        with self._lock:
+            return dict(self._per_day.get(day or date.today().isoformat(), self._empty()))
+
+    def over_budget(self, user_id):
+        """True once the user's tokens today reach daily_budget (0 = unlimited)."""
+        if not self.daily_budget:
+            return False
+        if self.user_today(user_id)["total"] >= self.daily_budget:
+            BUDGET_REJECTIONS.inc()
+            return True
+        return False
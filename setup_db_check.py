@@ -57,6 +57,18 @@ CREATE TABLE IF NOT EXISTS interactions (
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+CREATE INDEX IF NOT EXISTS idx_users_last_active ON users(last_active);
+
 CREATE INDEX IF NOT EXISTS idx_interactions_user_created ON interactions(user_id, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_interactions_created_id ON interactions(created_at, id);
+
+CREATE TABLE IF NOT EXISTS user_progress (
+    user_id BIGINT PRIMARY KEY REFERENCES users(user_id),
+    lesson_index INTEGER DEFAULT 0,
+    phrase_stats JSONB DEFAULT '{}'::jsonb,
+    total_attempts INTEGER DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
     """)
     print("-" * 50)